@@ -0,0 +1,30 @@
+"""add messages (chat_id, created_at, id) index
+
+Revision ID: a1c3e5f7b9d2
+Revises: f7b8c9d0e1f2
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f7b9d2'
+down_revision = 'f7b8c9d0e1f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Keyset pagination of chat history by (created_at, id)
+    op.create_index(
+        'ix_messages_chat_created_id',
+        'messages',
+        ['chat_id', 'created_at', 'id'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_chat_created_id', table_name='messages')
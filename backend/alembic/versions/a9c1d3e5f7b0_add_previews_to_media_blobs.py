@@ -0,0 +1,25 @@
+"""add previews to media_blobs
+
+Revision ID: a9c1d3e5f7b0
+Revises: f8b0c2d4e6a9
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c1d3e5f7b0'
+down_revision = 'f8b0c2d4e6a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # NULL - previews not generated yet, {} - not applicable or failed
+    op.add_column('media_blobs', sa.Column('previews', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('media_blobs', 'previews')
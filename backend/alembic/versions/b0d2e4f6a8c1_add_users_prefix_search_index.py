@@ -0,0 +1,29 @@
+"""add users prefix search index
+
+Revision ID: b0d2e4f6a8c1
+Revises: a9c1d3e5f7b0
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b0d2e4f6a8c1'
+down_revision = 'a9c1d3e5f7b0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Must match USER_SEARCH_EXPRESSION in app/models/user.py exactly;
+    # text_pattern_ops makes prefix lookups indexable regardless of collation
+    op.execute("""
+        CREATE INDEX ix_users_search_prefix ON users
+        (lower(first_name || ' ' || last_name || ' ' || username) text_pattern_ops)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_search_prefix', table_name='users')
@@ -0,0 +1,38 @@
+"""add last_message_id and last_message_at to chats
+
+Revision ID: b2d4f6a8c0e3
+Revises: a1c3e5f7b9d2
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d4f6a8c0e3'
+down_revision = 'a1c3e5f7b9d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('chats', sa.Column('last_message_id', sa.Integer(), nullable=True))
+    op.add_column('chats', sa.Column('last_message_at', sa.DateTime(timezone=True), nullable=True))
+
+    # Backfill from the newest message of every chat
+    op.execute("""
+        UPDATE chats c
+        SET last_message_id = m.id, last_message_at = m.created_at
+        FROM (
+            SELECT DISTINCT ON (chat_id) chat_id, id, created_at
+            FROM messages
+            ORDER BY chat_id, created_at DESC, id DESC
+        ) m
+        WHERE m.chat_id = c.id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('chats', 'last_message_at')
+    op.drop_column('chats', 'last_message_id')
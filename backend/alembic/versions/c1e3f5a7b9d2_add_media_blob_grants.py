@@ -0,0 +1,36 @@
+"""add media blob grants
+
+Revision ID: c1e3f5a7b9d2
+Revises: b0d2e4f6a8c1
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1e3f5a7b9d2'
+down_revision = 'b0d2e4f6a8c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Uploaders of each blob; blobs uploaded before this revision stay
+    # reachable only through attachments in the user's chats
+    op.create_table(
+        'media_blob_grants',
+        sa.Column('blob_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['blob_id'], ['media_blobs.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('blob_id', 'user_id')
+    )
+    op.create_index(op.f('ix_media_blob_grants_user_id'), 'media_blob_grants', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_media_blob_grants_user_id'), table_name='media_blob_grants')
+    op.drop_table('media_blob_grants')
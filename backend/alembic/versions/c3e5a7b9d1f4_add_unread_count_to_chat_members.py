@@ -0,0 +1,35 @@
+"""add unread_count to chat_members
+
+Revision ID: c3e5a7b9d1f4
+Revises: b2d4f6a8c0e3
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e5a7b9d1f4'
+down_revision = 'b2d4f6a8c0e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'chat_members',
+        sa.Column('unread_count', sa.Integer(), nullable=False, server_default='0')
+    )
+
+    # Read tracking never worked before, so existing history starts as read
+    op.execute("""
+        UPDATE chat_members cm
+        SET last_read_message_id = c.last_message_id
+        FROM chats c
+        WHERE c.id = cm.chat_id AND cm.last_read_message_id IS NULL
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('chat_members', 'unread_count')
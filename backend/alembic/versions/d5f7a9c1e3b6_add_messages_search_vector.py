@@ -0,0 +1,46 @@
+"""add messages full-text search vector
+
+Revision ID: d5f7a9c1e3b6
+Revises: c3e5a7b9d1f4
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f7a9c1e3b6'
+down_revision = 'c3e5a7b9d1f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Generated column: kept up to date by PostgreSQL on insert/update
+    op.add_column(
+        'messages',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "to_tsvector('russian'::regconfig, coalesce(content, '')) || "
+                "to_tsvector('english'::regconfig, coalesce(content, ''))",
+                persisted=True,
+            ),
+            nullable=True
+        )
+    )
+    op.create_index(
+        'ix_messages_search_vector',
+        'messages',
+        ['search_vector'],
+        unique=False,
+        postgresql_using='gin'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_search_vector', table_name='messages')
+    op.drop_column('messages', 'search_vector')
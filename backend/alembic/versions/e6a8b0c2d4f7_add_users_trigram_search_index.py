@@ -0,0 +1,29 @@
+"""add users trigram search index
+
+Revision ID: e6a8b0c2d4f7
+Revises: d5f7a9c1e3b6
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a8b0c2d4f7'
+down_revision = 'd5f7a9c1e3b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Must match USER_SEARCH_EXPRESSION in app/models/user.py exactly
+    op.execute("""
+        CREATE INDEX ix_users_search_trgm ON users
+        USING gin (lower(first_name || ' ' || last_name || ' ' || username) gin_trgm_ops)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_search_trgm', table_name='users')
@@ -0,0 +1,73 @@
+"""add content-addressed media blobs
+
+Revision ID: f8b0c2d4e6a9
+Revises: e6a8b0c2d4f7
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f8b0c2d4e6a9'
+down_revision = 'e6a8b0c2d4f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'media_blobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('path', sa.String(), nullable=False),
+        sa.Column('content_type', sa.String(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_media_blobs_id'), 'media_blobs', ['id'], unique=False)
+    op.create_index(op.f('ix_media_blobs_sha256'), 'media_blobs', ['sha256'], unique=True)
+
+    op.add_column('message_attachments', sa.Column('blob_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_message_attachments_blob_id'), 'message_attachments', ['blob_id'], unique=False)
+    op.create_foreign_key(
+        'message_attachments_blob_id_fkey', 'message_attachments', 'media_blobs',
+        ['blob_id'], ['id'], ondelete='RESTRICT'
+    )
+
+    # Reference counts live in the database so that cascaded deletes of
+    # messages and chats are counted too
+    op.execute("""
+        CREATE FUNCTION media_blobs_refcount() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.blob_id IS NOT NULL THEN
+                UPDATE media_blobs SET ref_count = ref_count + 1 WHERE id = NEW.blob_id;
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') AND OLD.blob_id IS NOT NULL THEN
+                UPDATE media_blobs SET ref_count = ref_count - 1, updated_at = now()
+                WHERE id = OLD.blob_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER message_attachments_blob_refcount
+        AFTER INSERT OR DELETE OR UPDATE OF blob_id ON message_attachments
+        FOR EACH ROW EXECUTE FUNCTION media_blobs_refcount()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS message_attachments_blob_refcount ON message_attachments")
+    op.execute("DROP FUNCTION IF EXISTS media_blobs_refcount()")
+    op.drop_constraint('message_attachments_blob_id_fkey', 'message_attachments', type_='foreignkey')
+    op.drop_index(op.f('ix_message_attachments_blob_id'), table_name='message_attachments')
+    op.drop_column('message_attachments', 'blob_id')
+    op.drop_index(op.f('ix_media_blobs_sha256'), table_name='media_blobs')
+    op.drop_index(op.f('ix_media_blobs_id'), table_name='media_blobs')
+    op.drop_table('media_blobs')
@@ -1,20 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, and_, or_
 from sqlalchemy.orm import selectinload
-from typing import List
-from datetime import datetime, timezone
+from typing import List, Optional
+from datetime import datetime
 
-from app.core.database import get_db
+from app.core.database import async_session_maker, get_db
+from app.core.pagination import decode_cursor, encode_cursor
 from app.core.security import get_current_user
 from app.models.user import User
 from app.models.chat import Chat, ChatMember, ChatType, ChatMemberRole
 from app.models.message import Message
-from app.schemas.chat import ChatCreate, ChatResponse, ChatUpdate
+from app.schemas.chat import ChatCreate, ChatResponse, ChatUpdate, UnreadCountsResponse
+from app.schemas.message import MessageResponse
+from app.websocket.manager import manager
+from app.websocket.membership import mark_chat_read, membership
 
 router = APIRouter()
 
 
+def _chat_response(chat: Chat, user_id: int) -> ChatResponse:
+    """Ответ по чату с загруженными members и счётчиком непрочитанных пользователя"""
+    response = ChatResponse.model_validate(chat)
+    member = next((m for m in chat.members if m.user_id == user_id), None)
+    response.unread_count = member.unread_count if member else None
+    return response
+
+
 @router.post("/", response_model=ChatResponse)
 async def create_chat(
     chat_data: ChatCreate,
@@ -50,41 +63,66 @@ async def create_chat(
     await db.commit()
     await db.refresh(new_chat)
     
+    # Сбрасываем индекс участников для WebSocket-маршрутизации
+    await manager.invalidate_chat(new_chat.id, [current_user.id, *chat_data.member_ids])
+    
     # Загрузка с members
     result = await db.execute(
         select(Chat).options(selectinload(Chat.members)).where(Chat.id == new_chat.id)
     )
     chat = result.scalar_one()
     
-    return chat
+    return _chat_response(chat, current_user.id)
 
 
 @router.get("/", response_model=List[ChatResponse])
 async def get_user_chats(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    before: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    # Получаем все чаты пользователя
-    result = await db.execute(
-        select(Chat)
-        .join(ChatMember)
-        .where(ChatMember.user_id == current_user.id)
+    """Чаты пользователя с последним сообщением, новые сверху.
+
+    Последнее сообщение берётся по денормализованному chats.last_message_id
+    одним запросом. Без limit возвращаются все чаты; с limit следующая
+    страница запрашивается курсором before из заголовка X-Next-Cursor.
+    """
+    query = (
+        select(Chat, Message, ChatMember.unread_count)
+        .join(ChatMember, and_(ChatMember.chat_id == Chat.id, ChatMember.user_id == current_user.id))
+        .outerjoin(Message, Message.id == Chat.last_message_id)
         .options(selectinload(Chat.members))
+        # Чаты без сообщений - в конце, как и раньше
+        .order_by(Chat.last_message_at.desc().nulls_last(), Chat.id.desc())
     )
-    chats = result.scalars().all()
     
-    # Добавляем последнее сообщение для каждого чата
-    chat_responses = []
-    for chat in chats:
-        # Получаем последнее сообщение
-        last_msg_result = await db.execute(
-            select(Message)
-            .where(Message.chat_id == chat.id)
-            .order_by(Message.created_at.desc())
-            .limit(1)
-        )
-        last_message = last_msg_result.scalar_one_or_none()
+    if before:
+        last_message_at, chat_id = decode_cursor(before, 2)
+        try:
+            chat_id = int(chat_id)
+            last_message_at = datetime.fromisoformat(last_message_at) if last_message_at else None
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
         
+        if last_message_at is None:
+            query = query.where(Chat.last_message_at.is_(None), Chat.id < chat_id)
+        else:
+            query = query.where(or_(
+                Chat.last_message_at < last_message_at,
+                and_(Chat.last_message_at == last_message_at, Chat.id < chat_id),
+                Chat.last_message_at.is_(None)
+            ))
+    
+    if limit:
+        query = query.limit(limit)
+    
+    result = await db.execute(query)
+    rows = result.all()
+    
+    chat_responses = []
+    for chat, last_message, unread_count in rows:
         # Формируем ответ
         chat_dict = {
             "id": chat.id,
@@ -94,18 +132,38 @@ async def get_user_chats(
             "created_at": chat.created_at,
             "members": chat.members,
             "last_message": {
+                "id": last_message.id,
                 "content": last_message.content,
                 "created_at": last_message.created_at
-            } if last_message else None
+            } if last_message else None,
+            "unread_count": unread_count
         }
         chat_responses.append(chat_dict)
     
-    # Сортируем по времени последнего сообщения (новые сверху)
-    chat_responses.sort(key=lambda x: x["last_message"]["created_at"] if x["last_message"] else datetime.min.replace(tzinfo=timezone.utc), reverse=True)
+    if limit and len(rows) == limit:
+        last_chat = rows[-1][0]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            last_chat.last_message_at.isoformat() if last_chat.last_message_at else None,
+            last_chat.id
+        )
     
     return chat_responses
 
 
+@router.get("/unread-counts", response_model=UnreadCountsResponse)
+async def get_unread_counts(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Непрочитанные во всех чатах пользователя одним запросом"""
+    result = await db.execute(
+        select(ChatMember.chat_id, ChatMember.unread_count)
+        .where(ChatMember.user_id == current_user.id)
+    )
+    counts = {chat_id: count for chat_id, count in result.all()}
+    return {"counts": counts, "total": sum(counts.values())}
+
+
 @router.get("/{chat_id}", response_model=ChatResponse)
 async def get_chat(
     chat_id: int,
@@ -127,7 +185,7 @@ async def get_chat(
     if not is_member:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    return chat
+    return _chat_response(chat, current_user.id)
 
 
 @router.put("/{chat_id}", response_model=ChatResponse)
@@ -158,7 +216,7 @@ async def update_chat(
     await db.commit()
     await db.refresh(chat)
     
-    return chat
+    return _chat_response(chat, current_user.id)
 
 
 @router.delete("/{chat_id}")
@@ -182,40 +240,67 @@ async def delete_chat(
     if not member or member.role != ChatMemberRole.OWNER:
         raise HTTPException(status_code=403, detail="Only owner can delete chat")
     
+    member_ids = [m.user_id for m in chat.members]
     await db.delete(chat)
     await db.commit()
     
+    # Сбрасываем индекс участников для WebSocket-маршрутизации
+    await manager.invalidate_chat(chat_id, member_ids)
+    
     return {"message": "Chat deleted successfully"}
 
 
+# Сообщений на одну порцию серверного курсора при выгрузке
+EXPORT_BATCH_SIZE = 500
+
+
+async def _stream_chat_messages(chat_id: int, ndjson: bool):
+    """Порционная выгрузка истории чата через серверный курсор.
+
+    Ответ отдаётся уже после завершения обработчика, поэтому у генератора
+    своя сессия, а не сессия запроса из get_db.
+    """
+    async with async_session_maker() as db:
+        result = await db.stream(
+            select(Message)
+            .options(selectinload(Message.attachments))
+            .where(Message.chat_id == chat_id)
+            .order_by(Message.created_at, Message.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        
+        if not ndjson:
+            yield "["
+        first = True
+        async for partition in result.scalars().partitions():
+            rows = [MessageResponse.model_validate(message).model_dump_json() for message in partition]
+            if ndjson:
+                yield "".join(row + "\n" for row in rows)
+            else:
+                chunk = ",".join(rows)
+                yield chunk if first else "," + chunk
+                first = False
+        if not ndjson:
+            yield "]"
+
+
 @router.get("/{chat_id}/messages")
 async def get_chat_messages(
     chat_id: int,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
+    """Выгрузка всей истории чата потоком (JSON-массив или NDJSON)"""
     # Проверяем, что пользователь является участником чата
-    member_result = await db.execute(
-        select(ChatMember)
-        .where(
-            ChatMember.chat_id == chat_id,
-            ChatMember.user_id == current_user.id
-        )
-    )
-    member = member_result.scalar_one_or_none()
-    
-    if not member:
+    if not await membership.is_member(chat_id, current_user.id, db):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Получаем сообщения с вложениями
-    result = await db.execute(
-        select(Message)
-        .options(selectinload(Message.attachments))
-        .where(Message.chat_id == chat_id)
-        .order_by(Message.created_at)
+    ndjson = format == "ndjson"
+    return StreamingResponse(
+        _stream_chat_messages(chat_id, ndjson),
+        media_type="application/x-ndjson" if ndjson else "application/json"
     )
-    messages = result.scalars().all()
-    return messages
 
 
 @router.delete("/{chat_id}/messages")
@@ -242,6 +327,17 @@ async def clear_chat_messages(
     await db.execute(
         delete(Message).where(Message.chat_id == chat_id)
     )
+    await db.execute(
+        update(Chat)
+        .where(Chat.id == chat_id)
+        .values(last_message_id=None, last_message_at=None)
+    )
+    # Непрочитанных больше нет ни у кого из участников
+    await db.execute(
+        update(ChatMember)
+        .where(ChatMember.chat_id == chat_id)
+        .values(unread_count=0, last_read_message_id=None)
+    )
     await db.commit()
     
     return {"message": "Chat history cleared"}
@@ -267,9 +363,8 @@ async def get_unread_count(
     if not member:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Временно возвращаем 0 до применения миграции
-    # TODO: Реализовать подсчет после добавления поля last_read_at
-    return {"count": 0}
+    # Счётчик поддерживается при записи - историю чата не сканируем
+    return {"count": member.unread_count}
 
 
 @router.post("/{chat_id}/mark-read")
@@ -279,21 +374,7 @@ async def mark_messages_as_read(
     db: AsyncSession = Depends(get_db)
 ):
     """Отметить все сообщения в чате как прочитанные"""
-    # Проверяем, что пользователь является участником чата
-    member_result = await db.execute(
-        select(ChatMember)
-        .where(
-            ChatMember.chat_id == chat_id,
-            ChatMember.user_id == current_user.id
-        )
-    )
-    member = member_result.scalar_one_or_none()
-    
-    if not member:
+    if not await mark_chat_read(db, chat_id, current_user.id):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Временно отключено до применения миграции
-    # member.last_read_at = datetime.utcnow()
-    # await db.commit()
-    
     return {"message": "Messages marked as read"}
@@ -1,19 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Query, Response
+from fastapi.responses import RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
+from sqlalchemy import select, or_, and_, tuple_, update, func, cast
+from sqlalchemy.dialects.postgresql import REGCONFIG
 from sqlalchemy.orm import selectinload
-from typing import List
-import os
-import uuid
+from typing import List, Optional
+from datetime import datetime
+import logging
+import re
 
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.core.config import settings
+from app.core.pagination import decode_cursor, encode_cursor
+from app.core.media_store import BLOBS_URL, store_upload, touch_blob, resolve_blob, generate_blob_previews
+from app.core.thumbnails import pick_preview
 from app.models.user import User
 from app.models.chat import Chat, ChatMember
 from app.models.message import Message, MessageReaction, MessageAttachment, MessageType
-from app.schemas.message import MessageCreate, MessageResponse, MessageUpdate, MessageReactionCreate
+from app.schemas.message import MessageCreate, MessageResponse, MessageUpdate, MessageReactionCreate, MessageSearchResult, MediaBlobResponse
 from app.websocket.manager import manager
+from app.websocket.membership import membership
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -24,14 +33,8 @@ async def create_message(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    # Проверка доступа к чату
-    result = await db.execute(
-        select(ChatMember).where(
-            ChatMember.chat_id == message_data.chat_id,
-            ChatMember.user_id == current_user.id
-        )
-    )
-    if not result.scalar_one_or_none():
+    # Проверка доступа к чату (через общий индекс участников)
+    if not await membership.is_member(message_data.chat_id, current_user.id, db):
         raise HTTPException(status_code=403, detail="Access denied")
     
     new_message = Message(
@@ -54,8 +57,46 @@ async def create_message(
             file_type=message_data.attachment.file_type,
             file_size=message_data.attachment.file_size
         )
+        # Ссылка на файл хранилища (ref_count увеличит триггер в БД);
+        # сослаться можно только на свою загрузку или уже видимый файл
+        blob = await resolve_blob(
+            db, message_data.attachment.blob_id, message_data.attachment.file_path, current_user.id
+        )
+        if blob is None and (
+            message_data.attachment.blob_id is not None
+            or message_data.attachment.file_path.startswith(BLOBS_URL)
+        ):
+            raise HTTPException(status_code=400, detail="Unknown blob")
+        if blob is not None:
+            attachment.blob_id = blob.id
+            attachment.file_path = blob.path
+            attachment.file_size = blob.size
         db.add(attachment)
     
+    # Денормализованное последнее сообщение для списка чатов
+    # (now() в той же транзакции совпадает с created_at сообщения);
+    # указатель только растёт, даже если параллельная отправка закоммитится позже
+    await db.execute(
+        update(Chat)
+        .where(
+            Chat.id == message_data.chat_id,
+            or_(Chat.last_message_id.is_(None), Chat.last_message_id < new_message.id)
+        )
+        .values(last_message_id=new_message.id, last_message_at=func.now())
+    )
+    
+    # Счётчики непрочитанных: остальным +1, у отправителя всё прочитано
+    await db.execute(
+        update(ChatMember)
+        .where(ChatMember.chat_id == message_data.chat_id, ChatMember.user_id != current_user.id)
+        .values(unread_count=ChatMember.unread_count + 1)
+    )
+    await db.execute(
+        update(ChatMember)
+        .where(ChatMember.chat_id == message_data.chat_id, ChatMember.user_id == current_user.id)
+        .values(last_read_message_id=new_message.id, unread_count=0)
+    )
+    
     await db.commit()
     await db.refresh(new_message, ['attachments'])
     
@@ -75,33 +116,68 @@ async def create_message(
     return new_message
 
 
+def _message_cursor(message: Message) -> str:
+    return encode_cursor(message.created_at.isoformat(), message.id)
+
+
+def _parse_message_cursor(cursor: str):
+    created_at, message_id = decode_cursor(cursor, 2)
+    try:
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/chat/{chat_id}", response_model=List[MessageResponse])
 async def get_chat_messages(
     chat_id: int,
+    response: Response,
     skip: int = 0,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    # Проверка доступа
-    result = await db.execute(
-        select(ChatMember).where(
-            ChatMember.chat_id == chat_id,
-            ChatMember.user_id == current_user.id
-        )
-    )
-    if not result.scalar_one_or_none():
+    """Сообщения чата от новых к старым.
+
+    Постраничный проход - курсорами: before (старее) и after (новее) из
+    заголовков X-Next-Cursor / X-Prev-Cursor предыдущего ответа. skip
+    оставлен для старых клиентов и используется только без курсоров.
+    """
+    # Проверка доступа (через общий индекс участников)
+    if not await membership.is_member(chat_id, current_user.id, db):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    result = await db.execute(
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after cursor")
+    
+    query = (
         select(Message)
         .where(Message.chat_id == chat_id, Message.is_deleted == False)
         .options(selectinload(Message.attachments))
-        .order_by(Message.created_at.desc())
-        .offset(skip)
-        .limit(limit)
     )
-    messages = result.scalars().all()
+    # Ключ (created_at, id) покрывается индексом ix_messages_chat_created_id
+    key = tuple_(Message.created_at, Message.id)
+    
+    if after:
+        # Более новые сообщения: идём вверх по индексу и разворачиваем
+        query = query.where(key > tuple_(*_parse_message_cursor(after)))
+        query = query.order_by(Message.created_at.asc(), Message.id.asc()).limit(limit)
+        result = await db.execute(query)
+        messages = list(reversed(result.scalars().all()))
+    else:
+        if before:
+            query = query.where(key < tuple_(*_parse_message_cursor(before)))
+        elif skip:
+            query = query.offset(skip)
+        query = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit)
+        result = await db.execute(query)
+        messages = result.scalars().all()
+    
+    if messages:
+        response.headers["X-Next-Cursor"] = _message_cursor(messages[-1])
+        response.headers["X-Prev-Cursor"] = _message_cursor(messages[0])
     
     return messages
 
@@ -149,9 +225,40 @@ async def delete_message(
     if message.sender_id != current_user.id:
         raise HTTPException(status_code=403, detail="Can only delete own messages")
     
+    if message.is_deleted:
+        return {"message": "Message deleted"}
+    
     message.is_deleted = True
     message.content = None
     
+    # Непрочитанное удалённое сообщение больше не считается непрочитанным
+    await db.execute(
+        update(ChatMember)
+        .where(
+            ChatMember.chat_id == message.chat_id,
+            ChatMember.user_id != current_user.id,
+            or_(ChatMember.last_read_message_id.is_(None), ChatMember.last_read_message_id < message.id)
+        )
+        .values(unread_count=func.greatest(ChatMember.unread_count - 1, 0))
+    )
+    
+    # Последним в списке чатов становится предыдущее неудалённое сообщение
+    previous = (
+        select(Message.id, Message.created_at)
+        .where(Message.chat_id == message.chat_id, Message.is_deleted == False, Message.id != message.id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(1)
+        .subquery()
+    )
+    await db.execute(
+        update(Chat)
+        .where(Chat.id == message.chat_id, Chat.last_message_id == message.id)
+        .values(
+            last_message_id=select(previous.c.id).scalar_subquery(),
+            last_message_at=select(previous.c.created_at).scalar_subquery()
+        )
+    )
+    
     await db.commit()
     
     # Отправляем уведомление через WebSocket
@@ -199,68 +306,179 @@ async def add_reaction(
 
 @router.post("/upload")
 async def upload_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     try:
-        # Проверка размера файла
-        content = await file.read()
-        file_size = len(content)
-        
-        if file_size > settings.MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="File too large (max 10MB)")
-        
-        if file_size == 0:
-            raise HTTPException(status_code=400, detail="File is empty")
+        # Хранилище по содержимому: одинаковые файлы хранятся один раз
+        blob = await store_upload(file, db, settings.MAX_FILE_SIZE, current_user.id)
         
-        # Создаем директорию media если её нет
-        os.makedirs("media", exist_ok=True)
-        
-        # Сохранение файла
-        file_ext = os.path.splitext(file.filename)[1] if file.filename else ".bin"
-        file_name = f"{uuid.uuid4()}{file_ext}"
-        file_path = os.path.join("media", file_name)
-        
-        with open(file_path, "wb") as f:
-            f.write(content)
+        # Превью изображений строятся после ответа, в пуле процессов
+        if blob.previews is None and blob.content_type.startswith("image/"):
+            background_tasks.add_task(generate_blob_previews, blob.id)
         
         return {
             "file_name": file.filename or "file",
-            "file_path": f"/media/{file_name}",
+            "file_path": blob.path,
             "file_type": file.content_type or "application/octet-stream",
-            "file_size": file_size
+            "file_size": blob.size,
+            "sha256": blob.sha256,
+            "blob_id": blob.id,
+            "previews": blob.previews
         }
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Upload error: {e}")
+        logger.exception("Upload failed")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
-@router.get("/search")
+@router.get("/attachments/{attachment_id}/preview")
+async def get_attachment_preview(
+    attachment_id: int,
+    size: int = Query(512, ge=1, le=4096),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Переход к наименьшему превью не меньше size (или к оригиналу)"""
+    result = await db.execute(
+        select(MessageAttachment, Message.chat_id)
+        .join(Message, Message.id == MessageAttachment.message_id)
+        .where(MessageAttachment.id == attachment_id)
+    )
+    row = result.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    attachment, chat_id = row
+    
+    if not await membership.is_member(chat_id, current_user.id, db):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    return RedirectResponse(pick_preview(attachment.previews, size) or attachment.file_path)
+
+
+@router.get("/blobs/{sha256}", response_model=MediaBlobResponse)
+async def get_blob(
+    sha256: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Проверка перед загрузкой: если файл уже есть, загружать его не нужно.
+
+    Находятся только файлы, которые пользователь загружал или видит во
+    вложениях своих чатов; иначе файл загружается заново (и дедуплицируется).
+    """
+    blob = await touch_blob(db, sha256.lower(), current_user.id)
+    if not blob:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    
+    return {
+        "blob_id": blob.id,
+        "file_path": blob.path,
+        "file_type": blob.content_type,
+        "file_size": blob.size,
+        "sha256": blob.sha256
+    }
+
+
+# Параметры фрагментов с подсветкой совпадений
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=30, MinWords=10, MaxFragments=2"
+
+
+# Последнее слово запроса, которое пользователь, возможно, ещё набирает
+_LAST_WORD = re.compile(r"(\w+)\s*$")
+
+
+def _search_tsquery(query: str):
+    """Запрос в синтаксисе веб-поиска для обоих языков вектора.
+
+    Последнее слово ищется по префиксу (to_tsquery с :*), чтобы поиск
+    находил сообщения по мере набора. Слово после "-" или внутри кавычек
+    остаётся в синтаксисе веб-поиска.
+    """
+    match = _LAST_WORD.search(query)
+    head = query[:match.start()] if match else query
+    if not match or head.rstrip().endswith("-") or head.count('"') % 2:
+        return func.websearch_to_tsquery(cast("russian", REGCONFIG), query).op("||")(
+            func.websearch_to_tsquery(cast("english", REGCONFIG), query)
+        )
+    
+    prefix = f"'{match.group(1)}':*"
+    parts = []
+    for config in ("russian", "english"):
+        part = func.to_tsquery(cast(config, REGCONFIG), prefix)
+        if head.strip():
+            part = func.websearch_to_tsquery(cast(config, REGCONFIG), head).op("&&")(part)
+        parts.append(part)
+    return parts[0].op("||")(parts[1])
+
+
+def _parse_search_cursor(cursor: str):
+    rank, message_id = decode_cursor(cursor, 2)
+    try:
+        return float(rank), int(message_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/search", response_model=List[MessageSearchResult])
 async def search_messages(
+    response: Response,
     query: str,
-    chat_id: int = None,
+    chat_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    # Базовый запрос
-    stmt = select(Message).where(
-        Message.is_deleted == False,
-        Message.content.ilike(f"%{query}%")
+    """Полнотекстовый поиск по сообщениям доступных пользователю чатов.
+
+    Результаты упорядочены по релевантности; следующая страница - по курсору
+    из заголовка X-Next-Cursor.
+    """
+    tsquery = _search_tsquery(query)
+    rank = func.ts_rank_cd(Message.search_vector, tsquery)
+    
+    # Страница идентификаторов по GIN-индексу; доступ - только через участие в чате
+    page = (
+        select(Message.id.label("id"), rank.label("rank"))
+        .join(ChatMember, and_(
+            ChatMember.chat_id == Message.chat_id,
+            ChatMember.user_id == current_user.id
+        ))
+        .where(Message.is_deleted == False, Message.search_vector.op("@@")(tsquery))
     )
-    
-    # Фильтр по чату
     if chat_id:
-        stmt = stmt.where(Message.chat_id == chat_id)
-    else:
-        # Только чаты пользователя
-        stmt = stmt.join(ChatMember).where(ChatMember.user_id == current_user.id)
+        page = page.where(Message.chat_id == chat_id)
+    if cursor:
+        page = page.where(tuple_(rank, Message.id) < tuple_(*_parse_search_cursor(cursor)))
+    page = page.order_by(rank.desc(), Message.id.desc()).limit(limit).subquery()
+    
+    # Фрагменты строятся только для сообщений страницы (ts_headline дорогой).
+    # В конфигурации russian латинские слова стеммятся как английские.
+    headline = func.ts_headline(cast("russian", REGCONFIG), Message.content, tsquery, HEADLINE_OPTIONS)
+    result = await db.execute(
+        select(Message, page.c.rank, headline)
+        .join(page, page.c.id == Message.id)
+        .options(selectinload(Message.attachments))
+        .order_by(page.c.rank.desc(), page.c.id.desc())
+    )
+    rows = result.all()
     
-    result = await db.execute(stmt.limit(50))
-    messages = result.scalars().all()
+    if len(rows) == limit:
+        last_message, last_rank, _ = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last_rank, last_message.id)
     
-    return messages
+    return [
+        MessageSearchResult(
+            **MessageResponse.model_validate(message).model_dump(),
+            rank=message_rank,
+            headline=message_headline
+        )
+        for message, message_rank, message_headline in rows
+    ]
 
 
 @router.post("/{message_id}/pin")
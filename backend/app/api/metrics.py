@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.core.database import pool_stats
+from app.core.metrics import metrics
+from app.core.security import get_current_user
+from app.models.user import User
+
+router = APIRouter()
+
+
+def _ratio(numerator: float, denominator: float):
+    return numerator / denominator if denominator else None
+
+
+@router.get("/")
+async def get_metrics(current_user: User = Depends(get_current_user)):
+    """Метрики процесса (только для администраторов)"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    
+    snapshot = metrics.snapshot()
+    counters = snapshot["counters"]
+    snapshot["derived"] = {
+        # Доля размера после сжатия (меньше - лучше)
+        "ws.compression.ratio": _ratio(
+            counters.get("ws.compression.bytes_out", 0),
+            counters.get("ws.compression.bytes_in", 0)
+        ),
+    }
+    return snapshot
+
+
+@router.get("/db-pool")
+async def get_db_pool_stats(current_user: User = Depends(get_current_user)):
+    """Состояние пула соединений с БД и время ожидания соединения"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    
+    snapshot = metrics.snapshot()
+    return {
+        "pool": pool_stats(),
+        "checkout_wait_seconds": snapshot["observations"].get("db.pool.checkout_wait_seconds"),
+        "timeouts": snapshot["counters"].get("db.pool.timeouts", 0),
+        "overflow_checkouts": snapshot["counters"].get("db.pool.overflow_checkouts", 0),
+    }
@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload, joinedload
 from typing import List
+import logging
 
 from app.core.database import get_db
 from app.core.security import get_current_user
@@ -10,6 +11,8 @@ from app.models.user import User
 from app.models.route import Route, RouteLocation, RouteAssignee, RouteStatus, LocationStatus
 from app.schemas.route import RouteCreate, RouteResponse, RouteUpdate
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
@@ -60,11 +63,8 @@ async def create_route(
     # Отправляем уведомления назначенным пользователям
     if route_data.assignee_ids:
         from app.websocket.manager import manager
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f"🗺️ Sending route notifications to {len(route_data.assignee_ids)} assignees")
+        logger.info("Route %s assigned to %s users", new_route.id, len(route_data.assignee_ids))
         for assignee_id in route_data.assignee_ids:
-            logger.info(f"🗺️ Sending notification to user {assignee_id} for route {new_route.id}")
             await manager.send_route_notification(
                 user_id=assignee_id,
                 route_id=new_route.id,
@@ -108,18 +108,6 @@ async def get_routes(
     )
     routes = result.scalars().unique().all()
     
-    # Отладка
-    import logging
-    logger = logging.getLogger(__name__)
-    for route in routes:
-        logger.info(f"🗺️ Route {route.id}: {len(route.assignees)} assignees")
-        for assignee in route.assignees:
-            logger.info(f"  👤 Assignee {assignee.id}: user_id={assignee.user_id}, user={assignee.user}")
-            if assignee.user:
-                logger.info(f"    ✅ User: {assignee.user.first_name} {assignee.user.last_name}, phone={assignee.user.phone}")
-            else:
-                logger.info(f"    ❌ User is None!")
-    
     return routes
 
 
@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from typing import List
+import logging
 
 from app.core.database import get_db
 from app.core.security import get_current_user
@@ -10,6 +11,8 @@ from app.models.user import User
 from app.models.task import Task, TaskAssignee, TaskComment, SubTask
 from app.schemas.task import TaskCreate, TaskResponse, TaskUpdate, TaskCommentCreate, SubTaskCreate
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
@@ -47,11 +50,8 @@ async def create_task(
     # Отправляем уведомления назначенным пользователям
     if task_data.assignee_ids:
         from app.websocket.manager import manager
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f"📋 Sending task notifications to {len(task_data.assignee_ids)} assignees")
+        logger.info("Task %s assigned to %s users", new_task.id, len(task_data.assignee_ids))
         for assignee_id in task_data.assignee_ids:
-            logger.info(f"📋 Sending notification to user {assignee_id} for task {new_task.id}")
             await manager.send_task_notification(
                 user_id=assignee_id,
                 task_id=new_task.id,
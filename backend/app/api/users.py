@@ -1,16 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, extract, func
+from sqlalchemy import select, or_, extract, func, literal, literal_column
 from typing import List
 from datetime import datetime, date
 
+from app.core.cache import user_cache
 from app.core.database import get_db
 from app.core.security import get_current_user
-from app.models.user import User, UserStatus
-from app.schemas.user import UserResponse, UserUpdate
+from app.models.user import User, UserStatus, USER_SEARCH_EXPRESSION
+from app.schemas.user import UserResponse, UserUpdate, UserBrief
 
 router = APIRouter()
 
+# То же выражение, что в индексах ix_users_search_trgm и ix_users_search_prefix
+search_text = literal_column(USER_SEARCH_EXPRESSION)
+
+# Короче этого у pg_trgm нет триграмм, и поиск по индексу вырождается в полный проход
+TRIGRAM_MIN_LENGTH = 3
+
+
+def _starts_with(term: str):
+    """Префикс через операторы text_pattern_ops (индекс ix_users_search_prefix).
+
+    Диапазон [term, следующая строка) работает и в подготовленных запросах,
+    где LIKE с параметром по btree не ищется.
+    """
+    condition = search_text.op("~>=~")(literal(term))
+    if ord(term[-1]) < 0x10FFFF:
+        upper = term[:-1] + chr(ord(term[-1]) + 1)
+        condition = condition & search_text.op("~<~")(literal(upper))
+    return condition
+
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
@@ -27,6 +47,7 @@ async def update_current_user(
         setattr(current_user, field, value)
     
     await db.commit()
+    user_cache.invalidate(current_user.id)
     await db.refresh(current_user)
     return current_user
 
@@ -42,13 +63,16 @@ async def get_users(
     query = select(User).where(User.is_active == True)
     
     if search:
+        # Подстрока или нечёткое совпадение слова (опечатки); оба условия
+        # обслуживает GIN-индекс pg_trgm, порядок - по похожести
+        term = search.strip().lower()
+        similarity = func.word_similarity(literal(term), search_text)
         query = query.where(
             or_(
-                User.username.ilike(f"%{search}%"),
-                User.first_name.ilike(f"%{search}%"),
-                User.last_name.ilike(f"%{search}%")
+                search_text.contains(term, autoescape=True),
+                literal(term).op("<%")(search_text)
             )
-        )
+        ).order_by(similarity.desc(), User.id)
     
     query = query.offset(skip).limit(limit)
     result = await db.execute(query)
@@ -57,6 +81,44 @@ async def get_users(
     return users
 
 
+@router.get("/autocomplete", response_model=List[UserBrief])
+async def autocomplete_users(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=20),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Подсказки по началу имени, фамилии или логина (на каждое нажатие клавиши).
+
+    Пока введено меньше TRIGRAM_MIN_LENGTH символов, ищется только начало
+    строки (имя) - по btree-индексу.
+    """
+    term = q.strip().lower()
+    if not term:
+        return []
+    prefix = _starts_with(term)
+    condition = prefix
+    if len(term) >= TRIGRAM_MIN_LENGTH:
+        # Начало фамилии или логина - через GIN-индекс pg_trgm
+        condition = or_(prefix, search_text.contains(f" {term}", autoescape=True))
+    
+    result = await db.execute(
+        select(User.id, User.username, User.first_name, User.last_name, User.avatar_url)
+        .where(User.is_active == True, condition)
+        # Совпадение с начала строки (имени) выше, затем по похожести
+        .order_by(prefix.desc(), func.word_similarity(literal(term), search_text).desc(), User.id)
+        .limit(limit)
+    )
+    return result.all()
+
+
+@router.get("/online", response_model=List[int])
+async def get_online_users(current_user: User = Depends(get_current_user)):
+    """Список id пользователей онлайн (из памяти, без запроса к БД)"""
+    from app.websocket.manager import manager
+    return manager.get_online_users()
+
+
 @router.get("/birthdays", response_model=List[UserResponse])
 async def get_upcoming_birthdays(
     db: AsyncSession = Depends(get_db),
@@ -118,6 +180,7 @@ async def update_user(
         setattr(user, field, value)
     
     await db.commit()
+    user_cache.invalidate(user.id)
     await db.refresh(user)
     
     return user
@@ -133,19 +196,36 @@ async def update_status(
     current_user.last_seen = datetime.utcnow()
     
     await db.commit()
+    user_cache.invalidate(current_user.id)
     await db.refresh(current_user)
     
     return current_user
 
 
-from fastapi import UploadFile, File
+from fastapi import UploadFile, File, BackgroundTasks
+from fastapi.responses import RedirectResponse
 import os
 import uuid
+import aiofiles.os
 from app.core.config import settings
+from app.core.thumbnails import generate_previews, preview_sizes
+from app.core.uploads import save_upload, remove_file
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def _generate_avatar_previews(path: str):
+    """Превью аватара рядом с оригиналом: <имя>_<сторона>.webp"""
+    try:
+        await generate_previews(path, os.path.splitext(path)[0])
+    except Exception as e:
+        logger.warning("Avatar preview generation failed for %s: %s", path, e)
 
 
 @router.post("/me/avatar", response_model=UserResponse)
 async def upload_avatar(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
@@ -154,34 +234,53 @@ async def upload_avatar(
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
-    # Проверка размера файла
-    content = await file.read()
-    file_size = len(content)
-    
-    if file_size > 5 * 1024 * 1024:  # 5MB
-        raise HTTPException(status_code=400, detail="File too large (max 5MB)")
-    
-    # Сохранение файла
+    # Потоковая запись частями; размер проверяется по мере чтения
     file_ext = os.path.splitext(file.filename)[1]
     file_name = f"avatar_{current_user.id}_{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join("media", "avatars", file_name)
+    stored = await save_upload(file, os.path.join("media", "avatars", file_name), settings.MAX_AVATAR_SIZE)
+    background_tasks.add_task(_generate_avatar_previews, stored.path)
     
-    # Создание директории если не существует
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    
-    # Удаление старого аватара если есть
-    if current_user.avatar:
-        old_path = current_user.avatar.replace('/media/', 'media/')
-        if os.path.exists(old_path):
-            os.remove(old_path)
-    
-    # Сохранение нового файла
-    with open(file_path, "wb") as f:
-        f.write(content)
+    # Удаление старого аватара если есть (только загруженного сюда же:
+    # avatar_url можно задать и через PUT /me)
+    old_avatar = current_user.avatar_url or ""
+    if old_avatar.startswith("/media/avatars/"):
+        old_path = os.path.join("media", "avatars", os.path.basename(old_avatar))
+        await remove_file(old_path)
+        for size in preview_sizes():
+            await remove_file(f"{os.path.splitext(old_path)[0]}_{size}.webp")
     
     # Обновление пользователя
-    current_user.avatar = f"/media/avatars/{file_name}"
+    current_user.avatar_url = f"/media/avatars/{file_name}"
     await db.commit()
+    user_cache.invalidate(current_user.id)
     await db.refresh(current_user)
     
     return current_user
+
+
+@router.get("/{user_id}/avatar")
+async def get_avatar(
+    user_id: int,
+    size: int = Query(128, ge=1, le=4096),
+    db: AsyncSession = Depends(get_db)
+):
+    """Аватар нужного размера: переход к наименьшему превью не меньше size.
+
+    Без авторизации, как и сами файлы /media, чтобы работать в <img src>.
+    """
+    result = await db.execute(select(User.avatar_url).where(User.id == user_id))
+    avatar_url = result.scalar_one_or_none()
+    if not avatar_url:
+        raise HTTPException(status_code=404, detail="Avatar not found")
+    
+    if avatar_url.startswith("/media/avatars/"):
+        base = os.path.splitext(os.path.basename(avatar_url))[0]
+        for side in sorted(preview_sizes()):
+            if side < size:
+                continue
+            preview = os.path.join("media", "avatars", f"{base}_{side}.webp")
+            if await aiofiles.os.path.exists(preview):
+                return RedirectResponse(f"/media/avatars/{base}_{side}.webp")
+            break
+    
+    return RedirectResponse(avatar_url)
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional, Tuple
+import time
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+
+class TTLCache:
+    """LRU-кэш в памяти процесса с временем жизни записей.
+
+    Рассчитан на вызовы из одного event loop: операции синхронные и не
+    уступают управление, поэтому блокировка не нужна.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        # key -> (срок годности, значение); порядок - от давно использованных
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            metrics.inc(f"cache.{self.name}.misses")
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            metrics.inc(f"cache.{self.name}.misses")
+            return None
+        self._data.move_to_end(key)
+        metrics.inc(f"cache.{self.name}.hits")
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Сохранить значение; ttl короче общего - для записей с собственным сроком"""
+        lifetime = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._data[key] = (time.monotonic() + lifetime, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def invalidate_many(self, keys: Iterable[Hashable]):
+        for key in keys:
+            self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Снимки пользователей для get_current_user (user_id -> отсоединённый User)
+user_cache = TTLCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL, name="user")
+
+# Проверенные JWT (sha256 токена -> (user_id, тип токена))
+token_cache = TTLCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL, name="token")
@@ -4,12 +4,64 @@ from typing import List
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    # Пул соединений на воркер. Бюджет воркера: DB_POOL_SIZE + DB_MAX_OVERFLOW,
+    # а при WS_BROKER=postgres ещё WS_BROKER_POOL_SIZE + 1 (слушатель LISTEN);
+    # сумма по воркерам должна оставаться ниже max_connections PostgreSQL (20 в docker-compose)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 5  # временные соединения сверх пула
+    DB_POOL_TIMEOUT: float = 10.0  # секунды ожидания свободного соединения
+    DB_POOL_RECYCLE: int = 1800  # секунды жизни соединения
+    DB_POOL_PRE_PING: bool = True  # проверка соединения перед выдачей
+    DB_ECHO: bool = False  # логирование всех SQL-запросов
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     MAX_FILE_SIZE: int = 10485760  # 10MB
     ALLOWED_FILE_TYPES: str = "image/jpeg,image/png,image/gif,audio/ogg,audio/webm,application/pdf"
+    MAX_AVATAR_SIZE: int = 5242880  # 5MB
+    UPLOAD_CHUNK_SIZE: int = 262144  # байт за одну операцию записи загрузки
+    MEDIA_GC_INTERVAL: float = 3600.0  # период сборки мусора хранилища файлов
+    MEDIA_GC_GRACE: float = 86400.0  # секунды жизни файла без ссылок (загружен, но не отправлен)
+    THUMBNAIL_SIZES: str = "128,512,1280"  # стороны превью изображений (WebP)
+    THUMBNAIL_QUALITY: int = 80
+    THUMBNAIL_WORKERS: int = 1  # процессов генерации превью
+    MEDIA_CACHE_CONTROL: str = "public, max-age=31536000, immutable"  # имена файлов в media не переиспользуются
+    MEDIA_ACCEL_REDIRECT_PREFIX: str = ""  # например /protected-media/ - отдача файлов через nginx
+    # WebSocket
+    WS_SEND_TIMEOUT: float = 5.0  # секунды на отправку одного кадра
+    WS_OUTBOUND_QUEUE_SIZE: int = 256  # кадров в очереди одного соединения
+    WS_BACKPRESSURE_POLICY: str = "coalesce"  # coalesce, drop_typing, disconnect
+    WS_BROKER: str = "memory"  # memory, postgres (для нескольких воркеров)
+    WS_BROKER_CHANNEL: str = "ws_events"
+    WS_BROKER_POOL_SIZE: int = 2  # соединений asyncpg для NOTIFY (не из пула DB_POOL_SIZE)
+    WS_MSGPACK_ENABLED: bool = True  # подпротокол jobchat.msgpack (если установлен msgpack)
+    WS_COMPRESSION_ENABLED: bool = True  # подпротоколы "+deflate"
+    WS_COMPRESSION_THRESHOLD: int = 1024  # кадры меньше этого размера (байт) не сжимаются
+    WS_COMPRESSION_LEVEL: int = 6
+    WS_MAX_INBOUND_BYTES: int = 65536  # предел входящего кадра (после распаковки), иначе закрытие 1009
+    WS_REPLAY_BUFFER_SIZE: int = 200  # событий в буфере догрузки на пользователя
+    WS_REPLAY_RETENTION: float = 300.0  # секунды хранения буфера после отключения
+    WS_HEARTBEAT_INTERVAL: float = 30.0  # секунды тишины до серверного ping
+    WS_HEARTBEAT_MAX_MISSED: int = 2  # пропущенных интервалов до отключения
+    PRESENCE_GRACE_PERIOD: float = 10.0  # секунды до ухода в офлайн после отключения
+    PRESENCE_FLUSH_INTERVAL: float = 5.0  # период пакетной записи статусов в БД
+    TYPING_COALESCE_WINDOW: float = 3.0  # повторные typing в этом окне не рассылаются
+    TYPING_TTL: float = 6.0  # индикатор гаснет без нового кадра
+    TYPING_MAX_EVENTS_PER_CHAT: float = 5.0  # событий typing в секунду на чат
+    # Логи
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # json, text
+    LOG_LEVELS: str = "sqlalchemy.engine=WARNING,uvicorn.access=WARNING"  # уровни по модулям
+    LOG_SAMPLING: str = ""  # доля INFO/DEBUG по модулям, например "app.websocket=0.1"
+    # Пароли
+    PASSWORD_HASH_CONCURRENCY: int = 2  # одновременных вычислений bcrypt
+    PASSWORD_HASH_QUEUE_TIMEOUT: float = 5.0  # секунды ожидания в очереди до 503
+    # Кэш
+    USER_CACHE_SIZE: int = 10000  # пользователей в кэше get_current_user
+    USER_CACHE_TTL: float = 30.0  # секунды; ограничивает устаревание между воркерами
+    TOKEN_CACHE_SIZE: int = 10000  # проверенных JWT в кэше
+    TOKEN_CACHE_TTL: float = 900.0  # верхняя граница; запись не переживает exp токена
     
     class Config:
         env_file = ".env"
@@ -1,16 +1,64 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+import time
+
 from app.core.config import settings
+from app.core.metrics import metrics
 
 # Преобразуем URL для async
 DATABASE_URL = settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул соединений с замером ожидания свободного соединения"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        overflow = self.overflow()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            metrics.inc("db.pool.timeouts")
+            raise
+        finally:
+            metrics.observe("db.pool.checkout_wait_seconds", time.perf_counter() - started)
+        # Считаем только выдачи, для которых открыто новое соединение сверх пула
+        if self.overflow() > max(overflow, 0):
+            metrics.inc("db.pool.overflow_checkouts")
+        return connection
+
+
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=settings.DB_ECHO,
+    poolclass=InstrumentedPool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
 
 
+def pool_stats() -> dict:
+    """Текущее состояние пула соединений"""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # Отрицательное значение - сколько ещё можно открыть до pool_size
+        "overflow": pool.overflow(),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "timeout": pool.timeout(),
+    }
+
+
 async def get_db() -> AsyncSession:
     async with async_session_maker() as session:
         yield session
@@ -0,0 +1,127 @@
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+
+from app.core.config import settings
+
+# Стандартные атрибуты LogRecord; всё остальное пришло через extra=
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+
+def _parse_mapping(value: str) -> Dict[str, str]:
+    """"a=1,b=2" -> {"a": "1", "b": "2"}"""
+    mapping = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, _, val = item.partition("=")
+            mapping[key.strip()] = val.strip()
+    return mapping
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись; поля из extra= попадают в запись как есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """Кладёт в очередь запись с готовым текстом; трассировка остаётся отдельным полем"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю записей DEBUG/INFO для логгеров горячего пути.
+
+    Доля задаётся по префиксу имени логгера (самый длинный совпавший
+    префикс); WARNING и выше проходят всегда.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._cache: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            best = -1
+            for prefix, value in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+                    rate, best = value, len(prefix)
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+def setup_logging():
+    """Логи через очередь: вызывающий код только кладёт запись, пишет фоновый поток"""
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    rates = {name: float(rate) for name, rate in _parse_mapping(settings.LOG_SAMPLING).items()}
+    if rates:
+        # Отброшенные записи не форматируются и не попадают в очередь
+        queue_handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+    for name, level in _parse_mapping(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописать очередь и остановить фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
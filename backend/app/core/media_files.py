@@ -0,0 +1,158 @@
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+from typing import Optional, Tuple
+import mimetypes
+import os
+import re
+
+import aiofiles
+
+from app.core.config import settings
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_SHA256_NAME = re.compile(r"^[0-9a-f]{64}(_\d+)?$")
+
+
+def _etag(full_path: str, stat_result: os.stat_result) -> str:
+    """Сильный ETag: у файлов хранилища - по имени (хэш содержимого), иначе размер+mtime"""
+    name = os.path.splitext(os.path.basename(full_path))[0]
+    if _SHA256_NAME.match(name):
+        return f'"{name}"'
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Один диапазон bytes=a-b -> (start, end) включительно; None - диапазон невыполним.
+
+    Несколько диапазонов сразу не поддерживаются - на них отдаётся весь файл.
+    """
+    match = _RANGE.match(header.strip())
+    if not match:
+        raise ValueError(header)
+    first, last = match.groups()
+    if not first:
+        if not last:
+            raise ValueError(header)
+        # bytes=-N: последние N байт
+        length = int(last)
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # Синтаксически неверный диапазон игнорируется (RFC 9110)
+        raise ValueError(header)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return None
+    return start, end
+
+
+class RangeFileResponse(Response):
+    """Ответ 206 с частью файла, читаемой по кускам без блокировки event loop"""
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: str, start: int, end: int, headers: dict, send_body: bool):
+        super().__init__(status_code=206, headers=headers)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.send_body = send_body
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        remaining = self.end - self.start + 1
+        async with aiofiles.open(self.path, "rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # Файл укоротился во время отдачи - закрываем тело
+            await send({"type": "http.response.body", "body": b""})
+
+
+class MediaFiles(StaticFiles):
+    """Раздача /media: долгий кэш, сильные ETag, Range-запросы и X-Accel-Redirect.
+
+    Имена файлов в media уникальны (uuid или хэш содержимого), поэтому файл
+    по одному URL никогда не меняется и может кэшироваться как immutable.
+    """
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        size = stat_result.st_size
+        headers = {
+            "cache-control": settings.MEDIA_CACHE_CONTROL,
+            "etag": _etag(full_path, stat_result),
+            "accept-ranges": "bytes",
+        }
+
+        # У файлов хранилища без расширения тип неизвестен - не text/plain
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            headers=headers,
+            media_type=media_type,
+            stat_result=stat_result,
+            method=scope["method"],
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        if settings.MEDIA_ACCEL_REDIRECT_PREFIX and status_code == 200:
+            # Отдачу (включая Range) берёт на себя nginx
+            relative = os.path.relpath(full_path, str(self.directory)).replace(os.sep, "/")
+            return Response(
+                media_type=media_type,
+                headers={**headers, "x-accel-redirect": settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + relative},
+            )
+
+        range_header = request_headers.get("range")
+        if not range_header or status_code != 200:
+            return response
+        # If-Range: часть отдаётся, только если у клиента та же версия файла
+        if_range = request_headers.get("if-range")
+        if if_range and if_range != headers["etag"]:
+            return response
+
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return response
+        if byte_range is None:
+            return Response(status_code=416, headers={"content-range": f"bytes */{size}"})
+
+        start, end = byte_range
+        return RangeFileResponse(
+            full_path,
+            start,
+            end,
+            headers={
+                **headers,
+                "content-type": media_type,
+                "content-range": f"bytes {start}-{end}/{size}",
+                "content-length": str(end - start + 1),
+                "last-modified": response.headers["last-modified"],
+            },
+            send_body=scope["method"] != "HEAD",
+        )
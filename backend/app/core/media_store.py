@@ -0,0 +1,262 @@
+from fastapi import UploadFile
+from sqlalchemy import select, update, delete, exists, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import datetime, timedelta, timezone
+import asyncio
+import logging
+import os
+import re
+import time
+import uuid
+
+import aiofiles.os
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.core.metrics import metrics
+from app.core.thumbnails import generate_previews
+from app.core.uploads import save_upload, remove_file
+from app.models.chat import ChatMember
+from app.models.media import MediaBlob, MediaBlobGrant
+from app.models.message import Message, MessageAttachment
+
+logger = logging.getLogger(__name__)
+
+BLOBS_URL = "/media/blobs/"
+TMP_DIR = os.path.join("media", "tmp")
+_EXTENSION = re.compile(r"^\.[a-z0-9]{1,10}$")
+
+
+def blob_url(sha256: str, extension: str) -> str:
+    """URL файла: /media/blobs/ab/cd/<sha256><ext>"""
+    return f"{BLOBS_URL}{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def disk_path(url: str) -> str:
+    """Путь на диске по URL /media/..."""
+    return url.lstrip("/")
+
+
+async def _move_into_place(source: str, url: str):
+    destination = disk_path(url)
+    await aiofiles.os.makedirs(os.path.dirname(destination), exist_ok=True)
+    await aiofiles.os.replace(source, destination)
+
+
+def blob_visible_to(user_id: int):
+    """Условие доступа к blob: пользователь его загружал или видит вложение с ним.
+
+    Файлы /media раздаются без авторизации, поэтому URL blob'а нельзя
+    выдавать тем, кто не мог его видеть.
+    """
+    granted = exists().where(MediaBlobGrant.blob_id == MediaBlob.id, MediaBlobGrant.user_id == user_id)
+    attached = (
+        select(MessageAttachment.id)
+        .join(Message, Message.id == MessageAttachment.message_id)
+        .join(ChatMember, ChatMember.chat_id == Message.chat_id)
+        .where(MessageAttachment.blob_id == MediaBlob.id, ChatMember.user_id == user_id)
+        .exists()
+    )
+    return granted | attached
+
+
+async def grant_blob(db: AsyncSession, blob_id: int, user_id: int):
+    """Запомнить, что пользователь загрузил blob (без commit)"""
+    await db.execute(
+        insert(MediaBlobGrant)
+        .values(blob_id=blob_id, user_id=user_id)
+        .on_conflict_do_nothing(index_elements=[MediaBlobGrant.blob_id, MediaBlobGrant.user_id])
+    )
+
+
+async def touch_blob(db: AsyncSession, sha256: str, user_id: Optional[int] = None) -> Optional[MediaBlob]:
+    """Найти blob по хэшу и продлить его жизнь до привязки к сообщению.
+
+    С user_id находится только blob, доступный этому пользователю.
+    """
+    condition = MediaBlob.sha256 == sha256
+    if user_id is not None:
+        condition = condition & blob_visible_to(user_id)
+    result = await db.execute(
+        update(MediaBlob)
+        .where(condition)
+        .values(updated_at=func.now())
+        .returning(MediaBlob)
+        .execution_options(synchronize_session=False)
+    )
+    blob = result.scalar_one_or_none()
+    await db.commit()
+    return blob
+
+
+async def store_upload(file: UploadFile, db: AsyncSession, max_size: int, user_id: int) -> MediaBlob:
+    """Сохранение загрузки в хранилище по содержимому.
+
+    Повторная загрузка того же содержимого не создаёт второй файл: временная
+    копия удаляется и возвращается уже существующий blob. Загрузившему
+    выдаётся право ссылаться на blob.
+    """
+    temp = os.path.join(TMP_DIR, uuid.uuid4().hex)
+    stored = await save_upload(file, temp, max_size)
+    try:
+        blob = await touch_blob(db, stored.sha256)
+        if blob is not None:
+            await grant_blob(db, blob.id, user_id)
+            await db.commit()
+            metrics.inc("media.dedup_hits")
+            metrics.inc("media.dedup_bytes", stored.size)
+            # Файл мог пропасть (ручная чистка, сбой сборки мусора) - восстанавливаем
+            if not await aiofiles.os.path.exists(disk_path(blob.path)):
+                await _move_into_place(temp, blob.path)
+            return blob
+
+        extension = os.path.splitext(file.filename or "")[1].lower()
+        if not _EXTENSION.match(extension):
+            extension = ""
+        url = blob_url(stored.sha256, extension)
+        await _move_into_place(temp, url)
+
+        # Параллельная загрузка того же файла могла успеть вставить строку
+        result = await db.execute(
+            insert(MediaBlob)
+            .values(
+                sha256=stored.sha256,
+                path=url,
+                content_type=file.content_type or "application/octet-stream",
+                size=stored.size,
+            )
+            .on_conflict_do_update(index_elements=[MediaBlob.sha256], set_={"updated_at": func.now()})
+            .returning(MediaBlob)
+            .execution_options(populate_existing=True)
+        )
+        blob = result.scalar_one()
+        await grant_blob(db, blob.id, user_id)
+        await db.commit()
+        if blob.path != url:
+            await remove_file(disk_path(url))
+        metrics.inc("media.stored_bytes", stored.size)
+        return blob
+    finally:
+        await remove_file(temp)
+
+
+async def resolve_blob(db: AsyncSession, blob_id: Optional[int], file_path: str, user_id: int) -> Optional[MediaBlob]:
+    """Blob вложения: по id или по пути из ответа /upload.
+
+    None, если blob не найден или недоступен пользователю. Строка blob'а
+    блокируется FOR SHARE до конца транзакции: сборка мусора (FOR UPDATE
+    SKIP LOCKED) не удалит его, пока вложение не вставлено.
+    """
+    if blob_id is not None:
+        condition = MediaBlob.id == blob_id
+    elif file_path.startswith(BLOBS_URL):
+        condition = MediaBlob.path == file_path
+    else:
+        return None
+    result = await db.execute(
+        select(MediaBlob)
+        .where(condition, blob_visible_to(user_id))
+        .with_for_update(read=True, of=MediaBlob)
+    )
+    return result.scalar_one_or_none()
+
+
+async def generate_blob_previews(blob_id: int):
+    """Превью изображения (фоновая задача после загрузки)"""
+    async with async_session_maker() as db:
+        blob = await db.get(MediaBlob, blob_id)
+        if blob is None or blob.previews is not None or not blob.content_type.startswith("image/"):
+            return
+        source = disk_path(blob.path)
+        try:
+            previews = await generate_previews(source, os.path.splitext(source)[0])
+        except Exception as e:
+            # Пустой словарь: повторять попытку для этого файла не нужно
+            logger.warning("Preview generation failed for blob %s: %s", blob_id, e)
+            previews = {}
+        blob.previews = previews
+        await db.commit()
+
+
+async def collect_garbage(batch_size: int = 100) -> int:
+    """Удаление blob'ов без ссылок, не использовавшихся MEDIA_GC_GRACE секунд"""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.MEDIA_GC_GRACE)
+    removed = 0
+    async with async_session_maker() as db:
+        while True:
+            # Блокировка строк не даёт загрузке того же файла воскресить blob,
+            # пока его файл удаляется; другие воркеры пропускают эти строки
+            result = await db.execute(
+                select(MediaBlob)
+                .where(
+                    MediaBlob.ref_count <= 0,
+                    MediaBlob.updated_at < cutoff,
+                    ~exists().where(MessageAttachment.blob_id == MediaBlob.id)
+                )
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            blobs = result.scalars().all()
+            if not blobs:
+                break
+            for blob in blobs:
+                await remove_file(disk_path(blob.path))
+                for url in (blob.previews or {}).values():
+                    await remove_file(disk_path(url))
+            await db.execute(delete(MediaBlob).where(MediaBlob.id.in_([blob.id for blob in blobs])))
+            await db.commit()
+            removed += len(blobs)
+            if len(blobs) < batch_size:
+                break
+    return removed
+
+
+def _sweep_temp_files(max_age: float) -> int:
+    """Недописанные временные файлы после сбоев"""
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(TMP_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+class MediaGarbageCollector:
+    """Периодическая сборка мусора хранилища в фоне"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                blobs = await collect_garbage()
+                temp_files = await asyncio.to_thread(_sweep_temp_files, settings.MEDIA_GC_GRACE)
+                metrics.inc("media.gc_removed_blobs", blobs)
+                if blobs or temp_files:
+                    logger.info("Media GC removed %s blobs and %s temp files", blobs, temp_files)
+            except Exception as e:
+                logger.error("Media GC failed: %s", e)
+
+
+media_gc = MediaGarbageCollector(settings.MEDIA_GC_INTERVAL)
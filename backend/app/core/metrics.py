@@ -0,0 +1,43 @@
+from typing import Dict
+import threading
+
+
+class Metrics:
+    """Простые счётчики и наблюдения в памяти процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        # name -> [count, sum, max]
+        self._observations: Dict[str, list] = {}
+
+    def inc(self, name: str, value: float = 1):
+        """Увеличить счётчик"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        """Записать наблюдение (длительность, размер и т.п.)"""
+        with self._lock:
+            stats = self._observations.get(name)
+            if stats is None:
+                self._observations[name] = [1, value, value]
+            else:
+                stats[0] += 1
+                stats[1] += value
+                stats[2] = max(stats[2], value)
+
+    def counter(self, name: str) -> float:
+        return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict:
+        """Текущие значения всех метрик"""
+        with self._lock:
+            observations = {
+                name: {"count": count, "sum": total, "avg": total / count, "max": maximum}
+                for name, (count, total, maximum) in self._observations.items()
+            }
+            return {"counters": dict(self._counters), "observations": observations}
+
+
+metrics = Metrics()
@@ -1,11 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Optional, TypeVar
 from jose import JWTError, jwt
+import asyncio
 import bcrypt
+import hashlib
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 
+from app.core.cache import token_cache, user_cache
 from app.core.config import settings
 from app.core.database import get_db
 from app.models.user import User
@@ -13,6 +19,15 @@ from sqlalchemy import select
 
 security = HTTPBearer()
 
+T = TypeVar("T")
+
+# bcrypt отпускает GIL, поэтому потоков достаточно; семафор ограничивает очередь
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_CONCURRENCY,
+    thread_name_prefix="bcrypt",
+)
+_password_slots = asyncio.Semaphore(settings.PASSWORD_HASH_CONCURRENCY)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
@@ -22,6 +37,31 @@ def get_password_hash(password: str) -> str:
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 
+async def _run_password_job(func: Callable[..., T], *args) -> T:
+    """bcrypt в пуле потоков, чтобы не блокировать event loop; 503 при переполнении очереди"""
+    try:
+        await asyncio.wait_for(_password_slots.acquire(), timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service is busy, try again",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_executor, func, *args)
+    finally:
+        _password_slots.release()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_job(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_password_job(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -50,38 +90,54 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id_str: str = payload.get("sub")
-        token_type: str = payload.get("type")
-        
-        if user_id_str is None or token_type != "access":
-            raise credentials_exception
-        
-        user_id = int(user_id_str)
-            
-    except (JWTError, ValueError, TypeError):
+    user_id = decode_token(credentials.credentials, "access")
+    if user_id is None:
         raise credentials_exception
     
+    # Снимок из кэша присоединяется к сессии запроса без SELECT
+    snapshot = user_cache.get(user_id)
+    if snapshot is not None:
+        return await db.merge(snapshot, load=False)
+    
     result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalar_one_or_none()
     
     if user is None:
         raise credentials_exception
     
+    user_cache.set(user_id, _snapshot_user(user))
     return user
 
 
-def verify_refresh_token(token: str) -> Optional[int]:
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id_str: str = payload.get("sub")
-        token_type: str = payload.get("type")
-        
-        if user_id_str is None or token_type != "refresh":
+def _snapshot_user(user: User) -> User:
+    """Отсоединённая копия пользователя: не привязана ни к одной сессии"""
+    snapshot = User(**{column.key: getattr(user, column.key) for column in User.__table__.columns})
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+def decode_token(token: str, token_type: str) -> Optional[int]:
+    """user_id из действительного токена нужного типа, иначе None.
+
+    Проверенные токены кэшируются по sha256 до истечения exp, поэтому
+    повторные запросы с тем же токеном не проверяют подпись заново.
+    Недействительные токены не кэшируются.
+    """
+    digest = hashlib.sha256(token.encode("utf-8")).digest()
+    cached = token_cache.get(digest)
+    if cached is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            cached = (int(payload["sub"]), payload.get("type"))
+            expires_in = float(payload["exp"]) - time.time()
+        except (JWTError, KeyError, ValueError, TypeError):
             return None
-        
-        return int(user_id_str)
-    except (JWTError, ValueError, TypeError):
-        return None
+        if expires_in > 0:
+            token_cache.set(digest, cached, ttl=expires_in)
+    
+    user_id, cached_type = cached
+    return user_id if cached_type == token_type else None
+
+
+def verify_refresh_token(token: str) -> Optional[int]:
+    return decode_token(token, "refresh")
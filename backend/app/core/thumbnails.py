@@ -0,0 +1,75 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+import asyncio
+import multiprocessing
+import os
+
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def render_previews(source: str, target_prefix: str, sizes: List[int], quality: int) -> Dict[int, str]:
+    """Уменьшенные копии в WebP: {сторона: путь на диске}.
+
+    Выполняется в отдельном процессе. Размеры не меньше оригинала
+    пропускаются - для них клиент берёт сам оригинал.
+    """
+    previews = {}
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+        for size in sorted(sizes):
+            if max(image.size) <= size:
+                break
+            preview = image.copy()
+            preview.thumbnail((size, size), Image.LANCZOS)
+            path = f"{target_prefix}_{size}.webp"
+            preview.save(path, "WEBP", quality=quality, method=4)
+            previews[size] = path
+    return previews
+
+
+def preview_sizes() -> List[int]:
+    return [int(size) for size in settings.THUMBNAIL_SIZES.split(",")]
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: форк процесса с потоками (логи, bcrypt) может унести чужие блокировки
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def generate_previews(source: str, target_prefix: str) -> Dict[str, str]:
+    """Генерация превью в пуле процессов: {сторона: URL /media/...}"""
+    loop = asyncio.get_running_loop()
+    rendered = await loop.run_in_executor(
+        _get_executor(), render_previews, source, target_prefix, preview_sizes(), settings.THUMBNAIL_QUALITY
+    )
+    metrics.inc("media.previews_generated", len(rendered))
+    return {str(size): "/" + path.replace(os.sep, "/") for size, path in rendered.items()}
+
+
+def pick_preview(previews: Optional[Dict[str, str]], size: int) -> Optional[str]:
+    """Наименьшее превью не меньше size; если такого нет - None (нужен оригинал)"""
+    candidates = sorted((int(side), url) for side, url in (previews or {}).items())
+    for side, url in candidates:
+        if side >= size:
+            return url
+    return None
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,57 @@
+from fastapi import HTTPException, UploadFile
+from typing import NamedTuple
+import hashlib
+import os
+
+import aiofiles
+import aiofiles.os
+
+from app.core.config import settings
+
+
+class StoredUpload(NamedTuple):
+    path: str
+    size: int
+    sha256: str
+
+
+async def save_upload(file: UploadFile, destination: str, max_size: int) -> StoredUpload:
+    """Потоковая запись загрузки на диск частями с подсчётом sha256.
+
+    Файл пишется во временный .part и переименовывается только целиком;
+    превышение max_size обнаруживается на первом лишнем фрагменте.
+    """
+    await aiofiles.os.makedirs(os.path.dirname(destination), exist_ok=True)
+    partial = f"{destination}.part"
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(partial, "wb") as out:
+            while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File too large (max {max_size // (1024 * 1024)}MB)"
+                    )
+                digest.update(chunk)
+                await out.write(chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=400, detail="File is empty")
+
+        await aiofiles.os.replace(partial, destination)
+    except BaseException:
+        await remove_file(partial)
+        raise
+
+    return StoredUpload(destination, size, digest.hexdigest())
+
+
+async def remove_file(path: str):
+    """Удаление файла без блокировки event loop; отсутствие файла - не ошибка"""
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
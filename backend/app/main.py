@@ -1,10 +1,16 @@
 from fastapi import FastAPI, WebSocket, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import os
 
-from app.api import auth, users, chats, messages, tasks, routes, notes, vacations, notifications
-from app.websocket.manager import websocket_endpoint
+from app.api import auth, users, chats, messages, tasks, routes, notes, vacations, notifications, metrics
+from app.core.logging_config import setup_logging, stop_logging
+from app.core.media_files import MediaFiles
+from app.core.media_store import media_gc
+from app.core.thumbnails import shutdown_executor
+from app.websocket.manager import manager, websocket_endpoint
+
+# Логи пишет фоновый поток через очередь
+setup_logging()
 
 app = FastAPI(title="Corporate Messenger API", version="1.0.0")
 
@@ -21,7 +27,8 @@ app.add_middleware(
 
 # Статические файлы
 os.makedirs("media", exist_ok=True)
-app.mount("/media", StaticFiles(directory="media"), name="media")
+# Долгий кэш, ETag и Range (PDF, голосовые сообщения)
+app.mount("/media", MediaFiles(directory="media"), name="media")
 
 # API Routes
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
@@ -33,6 +40,23 @@ app.include_router(routes.router, prefix="/api/routes", tags=["Routes"])
 app.include_router(notes.router, prefix="/api/notes", tags=["Notes"])
 app.include_router(vacations.router, prefix="/api/vacations", tags=["Vacations"])
 app.include_router(notifications.router, prefix="/api/notifications", tags=["Notifications"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["Metrics"])
+
+@app.on_event("startup")
+async def on_startup():
+    # Брокер событий WebSocket между воркерами
+    await manager.start()
+    # Сборка мусора хранилища файлов
+    media_gc.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    media_gc.stop()
+    shutdown_executor()
+    await manager.stop()
+    stop_logging()
+
 
 # WebSocket
 @app.websocket("/ws")
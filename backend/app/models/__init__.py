@@ -1,6 +1,7 @@
 from app.models.user import User
 from app.models.chat import Chat, ChatMember
 from app.models.message import Message, MessageReaction, MessageAttachment
+from app.models.media import MediaBlob, MediaBlobGrant
 from app.models.task import Task, TaskAssignee, TaskComment, SubTask
 from app.models.route import Route, RouteLocation, RouteAssignee
 from app.models.note import Note
@@ -14,6 +15,8 @@ __all__ = [
     "Message",
     "MessageReaction",
     "MessageAttachment",
+    "MediaBlob",
+    "MediaBlobGrant",
     "Task",
     "TaskAssignee",
     "TaskComment",
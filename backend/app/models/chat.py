@@ -24,6 +24,9 @@ class Chat(Base):
     name = Column(String, nullable=True)  # Для групповых чатов
     chat_type = Column(SQLEnum(ChatType), nullable=False)
     avatar_url = Column(String, nullable=True)
+    # Последнее сообщение (обновляется при создании сообщения) - для списка чатов
+    last_message_id = Column(Integer, nullable=True)
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -40,6 +43,8 @@ class ChatMember(Base):
     role = Column(SQLEnum(ChatMemberRole), default=ChatMemberRole.MEMBER, nullable=False)
     joined_at = Column(DateTime(timezone=True), server_default=func.now())
     last_read_message_id = Column(Integer, nullable=True)
+    # Непрочитанные сообщения (увеличивается при новом сообщении, сбрасывается при прочтении)
+    unread_count = Column(Integer, default=0, server_default="0", nullable=False)
     # last_read_at = Column(DateTime(timezone=True), nullable=True)  # Временно отключено
 
     chat = relationship("Chat", back_populates="members")
@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON
+from sqlalchemy.sql import func
+
+from app.core.database import Base
+
+
+class MediaBlob(Base):
+    """Файл в хранилище по содержимому (media/blobs/ab/cd/<sha256><ext>)"""
+    __tablename__ = "media_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, index=True, nullable=False)
+    path = Column(String, nullable=False)  # URL вида /media/blobs/...
+    content_type = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    # Число ссылок из message_attachments; поддерживается триггером в БД,
+    # поэтому учитывает и каскадные удаления сообщений и чатов
+    ref_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Превью изображений {"128": "/media/blobs/..._128.webp"}; {} - не нужны или не удались
+    previews = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Последняя загрузка или потеря ссылки; от неё отсчитывается срок до сборки мусора
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class MediaBlobGrant(Base):
+    """Право ссылаться на blob: пользователь загружал это содержимое.
+
+    Одинаковые файлы хранятся один раз, поэтому загрузивших может быть
+    несколько. Остальные видят blob только через вложения в своих чатах.
+    """
+    __tablename__ = "media_blob_grants"
+
+    blob_id = Column(Integer, ForeignKey("media_blobs.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
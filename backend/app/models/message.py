@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Enum as SQLEnum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Index, Computed, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 import enum
 
@@ -21,6 +22,12 @@ class MessageStatus(str, enum.Enum):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Курсорная пагинация сообщений чата по (created_at, id)
+        Index("ix_messages_chat_created_id", "chat_id", "created_at", "id"),
+        # Полнотекстовый поиск по search_vector
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False)
@@ -35,6 +42,15 @@ class Message(Base):
     is_pinned = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Поисковый вектор (русский + английский), считается самой БД
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(
+            "to_tsvector('russian'::regconfig, coalesce(content, '')) || "
+            "to_tsvector('english'::regconfig, coalesce(content, ''))",
+            persisted=True,
+        ),
+    ))
 
     chat = relationship("Chat", back_populates="messages")
     reactions = relationship("MessageReaction", back_populates="message", cascade="all, delete-orphan")
@@ -62,6 +78,13 @@ class MessageAttachment(Base):
     file_path = Column(String, nullable=False)
     file_type = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
+    # Файл в хранилище по содержимому (у старых вложений пусто)
+    blob_id = Column(Integer, ForeignKey("media_blobs.id", ondelete="RESTRICT"), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     message = relationship("Message", back_populates="attachments")
+    blob = relationship("MediaBlob", lazy="joined")
+
+    @property
+    def previews(self):
+        return self.blob.previews if self.blob is not None else None
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Index, text, Enum as SQLEnum
 from sqlalchemy.sql import func
 from datetime import datetime
 import enum
@@ -18,8 +18,21 @@ class UserStatus(str, enum.Enum):
     AWAY = "away"
 
 
+# Строка поиска людей; индексируется pg_trgm, запросы должны использовать её дословно
+USER_SEARCH_EXPRESSION = "lower(first_name || ' ' || last_name || ' ' || username)"
+
+
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index(
+            "ix_users_search_trgm",
+            text(f"{USER_SEARCH_EXPRESSION} gin_trgm_ops"),
+            postgresql_using="gin",
+        ),
+        # Поиск по началу строки (автодополнение)
+        Index("ix_users_search_prefix", text(f"{USER_SEARCH_EXPRESSION} text_pattern_ops")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True, nullable=False)
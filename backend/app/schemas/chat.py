@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 from app.models.chat import ChatType, ChatMemberRole
 
 
@@ -26,7 +26,8 @@ class ChatMemberResponse(BaseModel):
 
 
 class LastMessageResponse(BaseModel):
-    content: str
+    id: Optional[int] = None
+    content: Optional[str] = None
     created_at: datetime
 
     class Config:
@@ -41,6 +42,13 @@ class ChatResponse(BaseModel):
     created_at: datetime
     members: List[ChatMemberResponse] = []
     last_message: Optional[LastMessageResponse] = None
+    # Непрочитанные текущего пользователя; None - обработчик их не загружал
+    unread_count: Optional[int] = None
 
     class Config:
         from_attributes = True
+
+
+class UnreadCountsResponse(BaseModel):
+    counts: Dict[int, int]  # chat_id -> непрочитанные
+    total: int
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 from app.models.message import MessageType, MessageStatus
 
 
@@ -9,6 +9,7 @@ class MessageAttachmentCreate(BaseModel):
     file_path: str
     file_type: str
     file_size: int
+    blob_id: Optional[int] = None  # из ответа /upload или /blobs/{sha256}
 
 
 class MessageCreate(BaseModel):
@@ -33,6 +34,8 @@ class MessageAttachmentResponse(BaseModel):
     file_path: str
     file_type: str
     file_size: int
+    blob_id: Optional[int] = None
+    previews: Optional[Dict[str, str]] = None  # сторона -> URL превью WebP
 
     class Config:
         from_attributes = True
@@ -55,3 +58,16 @@ class MessageResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class MediaBlobResponse(BaseModel):
+    blob_id: int
+    file_path: str
+    file_type: str
+    file_size: int
+    sha256: str
+
+
+class MessageSearchResult(MessageResponse):
+    rank: float
+    headline: Optional[str] = None  # фрагмент с совпадениями в <mark>
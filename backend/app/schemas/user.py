@@ -42,6 +42,18 @@ class UserResponse(UserBase):
         from_attributes = True
 
 
+class UserBrief(BaseModel):
+    """Минимум полей для автодополнения (упоминания, новый чат)"""
+    id: int
+    username: str
+    first_name: str
+    last_name: str
+    avatar_url: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
 class Token(BaseModel):
     access_token: str
     refresh_token: str
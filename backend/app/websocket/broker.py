@@ -0,0 +1,175 @@
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+from collections import OrderedDict
+import asyncio
+import json
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Обработчик конверта события в текущем процессе
+EnvelopeHandler = Callable[[dict], Awaitable[None]]
+
+
+class Broker(ABC):
+    """Доставка событий WebSocket между процессами (воркерами uvicorn)"""
+
+    def __init__(self, handler: EnvelopeHandler):
+        self.handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, envelope: dict):
+        """Доставка конверта во все процессы, включая текущий"""
+
+
+class InMemoryBroker(Broker):
+    """Брокер для одного процесса: конверт сразу обрабатывается локально"""
+
+    async def publish(self, envelope: dict):
+        await self.handler(envelope)
+
+
+class PostgresBroker(Broker):
+    """Брокер поверх PostgreSQL LISTEN/NOTIFY.
+
+    Конверт доставляется локально сразу, а остальным процессам - через
+    pg_notify. Payload NOTIFY ограничен ~8000 байт, поэтому крупные конверты
+    режутся на части с заголовком "origin:id:index:count:".
+    """
+
+    # Символов на часть: до 4 байт на символ в UTF-8 укладываются в лимит NOTIFY
+    CHUNK_CHARS = 1800
+    # Сколько незавершённых составных конвертов держим в памяти
+    MAX_PENDING = 1000
+    RECONNECT_DELAY = 1.0
+    MAX_RECONNECT_DELAY = 30.0
+
+    def __init__(self, handler: EnvelopeHandler, dsn: str, channel: str, pool_size: int = 2):
+        super().__init__(handler)
+        self.dsn = dsn
+        self.channel = channel
+        self.pool_size = pool_size
+        self.origin = uuid.uuid4().hex
+        self._sequence = 0
+        self._listen_conn = None
+        self._publish_pool = None
+        self._pending: "OrderedDict[Tuple[str, str], List[Optional[str]]]" = OrderedDict()
+        # Фоновые задачи (обработка конвертов, переподключение) до завершения
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopped = False
+
+    async def start(self):
+        import asyncpg
+
+        self._stopped = False
+        self._publish_pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=self.pool_size)
+        await self._listen()
+        logger.info("Postgres broker listening on channel %s", self.channel)
+
+    async def stop(self):
+        self._stopped = True
+        for task in list(self._tasks):
+            task.cancel()
+        if self._listen_conn is not None and not self._listen_conn.is_closed():
+            await self._listen_conn.close()
+        if self._publish_pool is not None:
+            await self._publish_pool.close()
+
+    async def _listen(self):
+        import asyncpg
+
+        self._listen_conn = await asyncpg.connect(self.dsn)
+        self._listen_conn.add_termination_listener(self._on_terminated)
+        await self._listen_conn.add_listener(self.channel, self._on_notify)
+
+    def _on_terminated(self, connection):
+        if not self._stopped:
+            logger.warning("Postgres broker listener connection lost, reconnecting")
+            self._spawn(self._reconnect())
+
+    async def _reconnect(self):
+        delay = self.RECONNECT_DELAY
+        while not self._stopped:
+            try:
+                await self._listen()
+                logger.info("Postgres broker listener reconnected")
+                return
+            except Exception as e:
+                logger.error("Postgres broker reconnect failed: %s", e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+
+    async def publish(self, envelope: dict):
+        await self.handler(envelope)
+
+        data = json.dumps(envelope, ensure_ascii=False, separators=(",", ":"))
+        parts = [data[i:i + self.CHUNK_CHARS] for i in range(0, len(data), self.CHUNK_CHARS)] or [""]
+        self._sequence += 1
+        message_id = str(self._sequence)
+
+        try:
+            async with self._publish_pool.acquire() as conn:
+                for index, part in enumerate(parts):
+                    payload = f"{self.origin}:{message_id}:{index}:{len(parts)}:{part}"
+                    await conn.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+        except Exception as e:
+            logger.error("Postgres broker publish failed: %s", e)
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str):
+        try:
+            origin, message_id, index, count, part = payload.split(":", 4)
+            index, count = int(index), int(count)
+        except ValueError:
+            logger.warning("Malformed broker payload ignored")
+            return
+
+        if origin == self.origin:
+            return
+
+        if count == 1:
+            data = part
+        else:
+            key = (origin, message_id)
+            parts = self._pending.setdefault(key, [None] * count)
+            parts[index] = part
+            if any(p is None for p in parts):
+                while len(self._pending) > self.MAX_PENDING:
+                    self._pending.popitem(last=False)
+                return
+            del self._pending[key]
+            data = "".join(parts)
+
+        try:
+            envelope = json.loads(data)
+        except ValueError:
+            logger.warning("Undecodable broker envelope ignored")
+            return
+
+        self._spawn(self._handle(envelope))
+
+    def _spawn(self, coro: Awaitable[None]):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, envelope: dict):
+        try:
+            await self.handler(envelope)
+        except Exception as e:
+            logger.error("Error handling broker envelope: %s", e)
+
+
+def create_broker(backend: str, handler: EnvelopeHandler, dsn: str, channel: str, pool_size: int = 2) -> Broker:
+    """Создание брокера по имени бэкенда из настроек"""
+    if backend == "memory":
+        return InMemoryBroker(handler)
+    if backend == "postgres":
+        return PostgresBroker(handler, dsn, channel, pool_size)
+    raise ValueError(f"Unknown WebSocket broker backend: {backend}")
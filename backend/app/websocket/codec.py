@@ -0,0 +1,180 @@
+from typing import Dict, List, Optional, Tuple, Union
+import json
+import time
+import zlib
+
+from app.core.metrics import metrics
+
+try:
+    import msgpack
+except ImportError:  # msgpack необязателен: без него доступен только JSON
+    msgpack = None
+
+Frame = Union[str, bytes]
+
+
+class FrameTooLarge(ValueError):
+    """Входящий кадр больше допустимого (закрытие с кодом 1009)"""
+
+
+def check_frame_size(data: Frame, limit: int):
+    """Проверка размера входящего кадра до разбора"""
+    # Символ занимает до 4 байт: строку кодируем, только если она может не уложиться
+    if isinstance(data, str):
+        if len(data) * 4 > limit and len(data.encode("utf-8")) > limit:
+            raise FrameTooLarge(limit)
+    elif len(data) > limit:
+        raise FrameTooLarge(limit)
+
+
+class JsonCodec:
+    """JSON в текстовых кадрах (формат по умолчанию)"""
+
+    name = "json"
+    subprotocol = "jobchat.json"
+
+    def encode(self, message: dict) -> Frame:
+        return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+    def decode(self, data: Frame) -> dict:
+        return json.loads(data)
+
+
+# Короткие ключи полей событий для MessagePack
+SHORT_KEYS: Dict[str, str] = {
+    "type": "t",
+    "chat_id": "c",
+    "user_id": "u",
+    "message": "m",
+    "message_id": "mi",
+    "content": "co",
+    "sender_id": "si",
+    "message_type": "mt",
+    "created_at": "ca",
+    "timestamp": "ts",
+    "is_typing": "it",
+    "status": "s",
+    "task_id": "ti",
+    "task_title": "tt",
+    "route_id": "ri",
+    "route_title": "rt",
+    "assigned_by": "ab",
+    "id": "i",
+    "seq": "q",
+}
+LONG_KEYS: Dict[str, str] = {short: long for long, short in SHORT_KEYS.items()}
+
+
+def _rename_keys(value, mapping: Dict[str, str]):
+    if isinstance(value, dict):
+        return {mapping.get(key, key): _rename_keys(item, mapping) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rename_keys(item, mapping) for item in value]
+    return value
+
+
+class MsgPackCodec:
+    """MessagePack в бинарных кадрах с короткими ключами полей"""
+
+    name = "msgpack"
+    subprotocol = "jobchat.msgpack"
+
+    def encode(self, message: dict) -> Frame:
+        return msgpack.packb(_rename_keys(message, SHORT_KEYS), use_bin_type=True)
+
+    def decode(self, data: Frame) -> dict:
+        if isinstance(data, str):
+            # Клиент может прислать служебный кадр текстом
+            return json.loads(data)
+        return _rename_keys(msgpack.unpackb(data, raw=False), LONG_KEYS)
+
+
+# Первый байт бинарного кадра в подпротоколах "+deflate"
+RAW_FLAG = b"\x00"
+DEFLATE_FLAG = b"\x01"
+
+
+class DeflateCodec:
+    """Сжатие крупных кадров поверх другого кодека (подпротокол "<inner>+deflate").
+
+    Кадры от threshold байт сжимаются raw deflate и уходят бинарными с
+    флагом 0x01. Мелкие кадры (ping, typing) не сжимаются: у JSON они
+    остаются текстовыми, у бинарных кодеков получают флаг 0x00. Входящие
+    кадры распаковываются не больше чем до max_inflated байт.
+    """
+
+    def __init__(self, inner, threshold: int, level: int, max_inflated: int):
+        self.inner = inner
+        self.threshold = threshold
+        self.level = level
+        self.max_inflated = max_inflated
+        self.name = f"{inner.name}+deflate"
+        self.subprotocol = f"{inner.subprotocol}+deflate"
+
+    def encode(self, message: dict) -> Frame:
+        data = self.inner.encode(message)
+        raw = data.encode("utf-8") if isinstance(data, str) else data
+
+        if len(raw) < self.threshold:
+            metrics.inc("ws.compression.skipped_frames")
+            return data if isinstance(data, str) else RAW_FLAG + raw
+
+        started = time.thread_time()
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(raw) + compressor.flush()
+        metrics.observe("ws.compression.cpu_seconds", time.thread_time() - started)
+        metrics.inc("ws.compression.frames")
+        metrics.inc("ws.compression.bytes_in", len(raw))
+        metrics.inc("ws.compression.bytes_out", len(compressed))
+        return DEFLATE_FLAG + compressed
+
+    def decode(self, data: Frame) -> dict:
+        if isinstance(data, bytes) and data[:1] in (RAW_FLAG, DEFLATE_FLAG):
+            payload = data[1:]
+            if data[:1] == DEFLATE_FLAG:
+                payload = self._inflate(payload)
+            if isinstance(self.inner, JsonCodec):
+                payload = payload.decode("utf-8")
+            return self.inner.decode(payload)
+        return self.inner.decode(data)
+
+    def _inflate(self, payload: bytes) -> bytes:
+        # Распаковка с пределом: защита от кадров-"бомб"
+        decompressor = zlib.decompressobj(-15)
+        inflated = decompressor.decompress(payload, self.max_inflated)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise FrameTooLarge(self.max_inflated)
+        return inflated
+
+
+JSON_CODEC = JsonCodec()
+
+
+def available_codecs(
+    msgpack_enabled: bool,
+    compression_enabled: bool = False,
+    compression_threshold: int = 1024,
+    compression_level: int = 6,
+    max_inflated: int = 65536,
+) -> List:
+    """Кодеки, которые сервер готов согласовать"""
+    codecs = []
+    if msgpack_enabled and msgpack is not None:
+        codecs.append(MsgPackCodec())
+    codecs.append(JSON_CODEC)
+    if compression_enabled:
+        codecs.extend([DeflateCodec(codec, compression_threshold, compression_level, max_inflated) for codec in codecs])
+    return codecs
+
+
+def negotiate(requested: List[str], codecs: List) -> Tuple[object, Optional[str]]:
+    """Выбор кодека по подпротоколам клиента (в порядке клиента).
+
+    Возвращает кодек и подпротокол для accept(); без совпадений - JSON без
+    подпротокола, как раньше.
+    """
+    by_subprotocol = {codec.subprotocol: codec for codec in codecs}
+    for subprotocol in requested or ():
+        if subprotocol in by_subprotocol:
+            return by_subprotocol[subprotocol], subprotocol
+    return JSON_CODEC, None
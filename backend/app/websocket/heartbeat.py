@@ -0,0 +1,98 @@
+from fastapi import WebSocket
+from typing import Callable, Dict, List, Optional, Set
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatWheel:
+    """Колесо таймеров heartbeat для всех соединений процесса.
+
+    Соединение попадает в один из слотов колеса; за interval секунд колесо
+    делает полный оборот, и каждый слот проверяется раз в оборот. Соединение,
+    от которого не было кадров весь interval, получает ping; после max_missed
+    пропущенных подряд интервалов оно считается мёртвым. Работает одна задача
+    на процесс, а не таймер на каждый сокет.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        max_missed: int,
+        on_ping: Callable[[WebSocket], None],
+        on_dead: Callable[[WebSocket], None],
+        tick: float = 1.0,
+    ):
+        self.interval = interval
+        self.max_missed = max_missed
+        self.tick = tick
+        self.on_ping = on_ping
+        self.on_dead = on_dead
+        # Вызывается раз в оборот колеса (уборка связанных структур)
+        self.on_rotation: Optional[Callable[[], None]] = None
+        self._slots: List[Set[WebSocket]] = [set() for _ in range(max(1, math.ceil(interval / tick)))]
+        self._position = 0
+        self._slot_of: Dict[WebSocket, int] = {}
+        self._last_seen: Dict[WebSocket, float] = {}
+        self._missed: Dict[WebSocket, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def add(self, websocket: WebSocket):
+        """Регистрация соединения: первая проверка через полный оборот"""
+        slot = (self._position - 1) % len(self._slots)
+        self._slots[slot].add(websocket)
+        self._slot_of[websocket] = slot
+        self._last_seen[websocket] = time.monotonic()
+        self._missed[websocket] = 0
+
+    def remove(self, websocket: WebSocket):
+        slot = self._slot_of.pop(websocket, None)
+        if slot is not None:
+            self._slots[slot].discard(websocket)
+        self._last_seen.pop(websocket, None)
+        self._missed.pop(websocket, None)
+
+    def touch(self, websocket: WebSocket):
+        """От клиента пришёл кадр - соединение живо"""
+        if websocket in self._last_seen:
+            self._last_seen[websocket] = time.monotonic()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                self._advance()
+            except Exception as e:
+                logger.error("Heartbeat tick failed: %s", e)
+
+    def _advance(self):
+        self._position = (self._position + 1) % len(self._slots)
+        if self._position == 0 and self.on_rotation:
+            self.on_rotation()
+
+        now = time.monotonic()
+        dead = []
+        for websocket in list(self._slots[self._position]):
+            if now - self._last_seen[websocket] < self.interval:
+                self._missed[websocket] = 0
+                continue
+            self._missed[websocket] += 1
+            if self._missed[websocket] >= self.max_missed:
+                dead.append(websocket)
+            else:
+                self.on_ping(websocket)
+
+        for websocket in dead:
+            self.remove(websocket)
+            self.on_dead(websocket)
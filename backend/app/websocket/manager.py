@@ -1,94 +1,299 @@
 from fastapi import WebSocket, WebSocketDisconnect, Query
-from typing import Dict, List, Set, Optional
-import json
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import asyncio
 from datetime import datetime
-from jose import jwt, JWTError
 from app.core.config import settings
+from app.core.database import async_session_maker
+from app.core.security import decode_token
+from app.websocket.broker import Broker, InMemoryBroker, create_broker
+from app.websocket.codec import JSON_CODEC, FrameTooLarge, available_codecs, check_frame_size, negotiate
+from app.websocket.heartbeat import HeartbeatWheel
+from app.websocket.membership import MembershipIndex, mark_chat_read, membership
+from app.websocket.outbound import BackpressurePolicy, ConnectionWriter
+from app.websocket.presence import PresenceTracker
+from app.websocket.replay import SEQUENCED_EVENTS, ReplayBuffer
+from app.websocket.typing_relay import TypingRelay
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, membership: MembershipIndex):
         # user_id -> List[WebSocket]
         self.active_connections: Dict[int, List[WebSocket]] = {}
-        # chat_id -> Set[user_id]
-        self.chat_members: Dict[int, Set[int]] = {}
-        # user_id -> Set[chat_id]
-        self.user_chats: Dict[int, Set[int]] = {}
-    
-    async def connect(self, websocket: WebSocket, user_id: int):
-        """Подключение пользователя"""
-        await websocket.accept()
+        # Участники чатов (общий с REST ленивый индекс)
+        self.membership = membership
+        # WebSocket -> исходящая очередь соединения
+        self.writers: Dict[WebSocket, ConnectionWriter] = {}
+        # Фоновые закрытия соединений (ссылки держим до завершения задач)
+        self._close_tasks: Set[asyncio.Task] = set()
+        self.backpressure_policy = BackpressurePolicy(settings.WS_BACKPRESSURE_POLICY)
+        # Форматы кадров, которые можно согласовать через подпротокол
+        self.codecs = available_codecs(
+            settings.WS_MSGPACK_ENABLED,
+            compression_enabled=settings.WS_COMPRESSION_ENABLED,
+            compression_threshold=settings.WS_COMPRESSION_THRESHOLD,
+            compression_level=settings.WS_COMPRESSION_LEVEL,
+            max_inflated=settings.WS_MAX_INBOUND_BYTES,
+        )
+        # До start() события доставляются только в текущем процессе
+        self.broker: Broker = InMemoryBroker(self._dispatch)
+        # Онлайн-статусы с отложенной записью в БД
+        self.presence = PresenceTracker(
+            grace_period=settings.PRESENCE_GRACE_PERIOD,
+            flush_interval=settings.PRESENCE_FLUSH_INTERVAL,
+        )
+        self.presence.on_change = self._on_presence_change
+        # Номера событий и буфер для догрузки после переподключения
+        self.replay = ReplayBuffer(
+            size=settings.WS_REPLAY_BUFFER_SIZE,
+            retention=settings.WS_REPLAY_RETENTION,
+        )
+        # Серверный heartbeat и отключение молчащих соединений
+        self.heartbeat = HeartbeatWheel(
+            interval=settings.WS_HEARTBEAT_INTERVAL,
+            max_missed=settings.WS_HEARTBEAT_MAX_MISSED,
+            on_ping=self._send_heartbeat,
+            on_dead=self._reap,
+        )
+        self.heartbeat.on_rotation = self.replay.purge
+        # Схлопывание и ограничение индикаторов печати
+        self.typing = TypingRelay(
+            self.send_typing_indicator,
+            coalesce_window=settings.TYPING_COALESCE_WINDOW,
+            ttl=settings.TYPING_TTL,
+            max_per_second=settings.TYPING_MAX_EVENTS_PER_CHAT,
+        )
+    
+    async def start(self):
+        """Запуск брокера событий и записи статусов (при старте приложения)"""
+        self.broker = create_broker(
+            settings.WS_BROKER,
+            self._dispatch,
+            dsn=settings.DATABASE_URL,
+            channel=settings.WS_BROKER_CHANNEL,
+            pool_size=settings.WS_BROKER_POOL_SIZE,
+        )
+        await self.broker.start()
+        if settings.WS_BROKER != "memory":
+            # Несколько воркеров: онлайн-пользователи сводятся через брокер
+            self.presence.publish = self._publish_presence
+        self.presence.start()
+        self.typing.start()
+        self.heartbeat.start()
+    
+    async def stop(self):
+        """Остановка брокера, записи статусов и всех исходящих очередей"""
+        self.heartbeat.stop()
+        self.typing.stop()
+        await self.presence.stop()
+        await self.broker.stop()
+        for writer in list(self.writers.values()):
+            writer.stop()
+        self.writers.clear()
+        for task in list(self._close_tasks):
+            task.cancel()
+    
+    async def connect(self, websocket: WebSocket, user_id: int) -> Tuple[str, int]:
+        """Подключение пользователя (с согласованием формата кадров).
+
+        Возвращает эпоху и последний номер события пользователя для resume.
+        """
+        codec, subprotocol = negotiate(websocket.scope.get("subprotocols", []), self.codecs)
+        await websocket.accept(subprotocol=subprotocol)
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
         self.active_connections[user_id].append(websocket)
-        logger.info(f"User {user_id} connected. Total connections: {len(self.active_connections)}")
+        
+        writer = ConnectionWriter(
+            websocket,
+            user_id,
+            codec,
+            max_size=settings.WS_OUTBOUND_QUEUE_SIZE,
+            policy=self.backpressure_policy,
+            send_timeout=settings.WS_SEND_TIMEOUT,
+            on_failure=self._on_writer_failure,
+        )
+        self.writers[websocket] = writer
+        writer.start()
+        self.heartbeat.add(websocket)
+        self.presence.connected(user_id)
+        logger.info("User %s connected, users online: %s", user_id, len(self.active_connections))
+        return self.replay.attach(user_id)
     
     def disconnect(self, websocket: WebSocket, user_id: int):
         """Отключение пользователя"""
+        writer = self.writers.pop(websocket, None)
+        if writer:
+            writer.stop()
+        self.heartbeat.remove(websocket)
+        
         if user_id in self.active_connections:
             try:
                 self.active_connections[user_id].remove(websocket)
                 if not self.active_connections[user_id]:
                     del self.active_connections[user_id]
-                logger.info(f"User {user_id} disconnected")
+                    self.replay.detach(user_id)
+                self.presence.disconnected(user_id)
+                logger.info("User %s disconnected", user_id)
             except ValueError:
                 pass
     
     def is_user_online(self, user_id: int) -> bool:
         """Проверка, онлайн ли пользователь"""
-        return user_id in self.active_connections and len(self.active_connections[user_id]) > 0
+        return self.presence.is_online(user_id)
     
     def get_online_users(self) -> List[int]:
         """Получить список онлайн пользователей"""
-        return list(self.active_connections.keys())
+        return self.presence.online_users()
+    
+    async def _on_presence_change(self, user_id: int, status: str):
+        """Рассылка смены статуса (после подавления кратких переподключений)"""
+        await self.send_user_status(user_id, status)
+        if status == "offline":
+            # Уведомление об отключении
+            chat_ids = await self.membership.get_user_chats(user_id)
+            if chat_ids:
+                await self.broadcast_to_chats({
+                    "type": "user_offline",
+                    "user_id": user_id,
+                    "timestamp": datetime.utcnow().isoformat()
+                }, chat_ids)
+    
+    def codec_for(self, websocket: WebSocket):
+        """Кодек соединения"""
+        writer = self.writers.get(websocket)
+        return writer.codec if writer else JSON_CODEC
+    
+    @staticmethod
+    def _coalesce_key(message: dict) -> Optional[Hashable]:
+        """Ключ, по которому устаревшие кадры можно заменить более свежими"""
+        message_type = message.get("type")
+        if message_type == "typing":
+            return ("typing", message.get("chat_id"), message.get("user_id"))
+        if message_type == "user_status":
+            return ("user_status", message.get("user_id"))
+        return None
+    
+    async def _close_quietly(self, websocket: WebSocket):
+        """Закрытие зависшего соединения без ожидания клиента"""
+        try:
+            await asyncio.wait_for(websocket.close(code=1011), timeout=settings.WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+    
+    def _evict(self, websocket: WebSocket, user_id: int):
+        """Отключение медленного или зависшего клиента"""
+        self.disconnect(websocket, user_id)
+        task = asyncio.create_task(self._close_quietly(websocket))
+        self._close_tasks.add(task)
+        task.add_done_callback(self._close_tasks.discard)
+    
+    def _on_writer_failure(self, writer: ConnectionWriter):
+        self._evict(writer.websocket, writer.user_id)
+    
+    def _send_heartbeat(self, websocket: WebSocket):
+        """Серверный ping молчащему соединению (клиент отвечает любым кадром)"""
+        self.send_to_connection(websocket, {
+            "type": "ping",
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    
+    def _reap(self, websocket: WebSocket):
+        """Отключение соединения, пропустившего heartbeat"""
+        writer = self.writers.get(websocket)
+        if writer:
+            logger.info("Reaping idle connection of user %s", writer.user_id)
+            self._evict(websocket, writer.user_id)
+    
+    def send_to_connection(self, websocket: WebSocket, message: dict):
+        """Постановка события в очередь конкретного соединения"""
+        writer = self.writers.get(websocket)
+        if writer and not writer.enqueue(message.get("type"), writer.codec.encode(message), self._coalesce_key(message)):
+            logger.warning("Outbound queue overflow for user %s, disconnecting slow consumer", writer.user_id)
+            self._evict(websocket, writer.user_id)
+    
+    async def _fan_out(self, message: dict, user_ids: Iterable[int]):
+        """Постановка события в очереди всех соединений указанных пользователей"""
+        # Сериализация один раз на каждый формат кадров
+        shared_encoded = {}
+        event_type = message.get("type")
+        coalesce_key = self._coalesce_key(message)
+        sequenced = event_type in SEQUENCED_EVENTS
+        overflowed = []
+        
+        for user_id in user_ids:
+            payload, encoded = message, shared_encoded
+            if sequenced and self.replay.tracks(user_id):
+                # Номер свой у каждого пользователя - кодируем для него отдельно
+                payload, encoded = self.replay.record(user_id, message), {}
+            
+            for connection in self.active_connections.get(user_id, ()):
+                writer = self.writers.get(connection)
+                if writer is None:
+                    continue
+                data = encoded.get(writer.codec.name)
+                if data is None:
+                    data = encoded[writer.codec.name] = writer.codec.encode(payload)
+                if not writer.enqueue(event_type, data, coalesce_key):
+                    overflowed.append((connection, user_id))
+        
+        # Отключаем клиентов, которые не успевают разгружать очередь
+        for connection, user_id in overflowed:
+            logger.warning("Outbound queue overflow for user %s, disconnecting slow consumer", user_id)
+            self._evict(connection, user_id)
+    
+    async def _dispatch(self, envelope: dict):
+        """Доставка конверта из брокера соединениям текущего процесса"""
+        if "invalidate_chat" in envelope:
+            self.membership.invalidate_chat(envelope["invalidate_chat"], envelope.get("user_ids", ()))
+            return
+        if "presence" in envelope:
+            await self.presence.handle(envelope["presence"])
+            return
+        
+        if not self.active_connections and not self.replay.has_streams():
+            return
+        
+        message = envelope["message"]
+        exclude_user_id = envelope.get("exclude_user_id")
+        
+        if "chat_ids" in envelope:
+            user_ids = set()
+            for chat_id in envelope["chat_ids"]:
+                user_ids.update(await self.membership.get_chat_members(chat_id))
+        else:
+            user_ids = envelope.get("user_ids", ())
+        
+        await self._fan_out(message, [user_id for user_id in user_ids if user_id != exclude_user_id])
+    
+    async def _publish_presence(self, envelope: dict):
+        await self.broker.publish({"presence": envelope})
+    
+    async def invalidate_chat(self, chat_id: int, user_ids: Iterable[int] = ()):
+        """Сброс индекса участников чата во всех процессах (после изменения состава)"""
+        await self.broker.publish({"invalidate_chat": chat_id, "user_ids": list(user_ids)})
     
     async def send_personal_message(self, message: dict, user_id: int):
         """Отправка личного сообщения пользователю"""
-        if user_id in self.active_connections:
-            disconnected = []
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    logger.error(f"Error sending message to user {user_id}: {e}")
-                    disconnected.append(connection)
-            
-            # Удаляем отключенные соединения
-            for conn in disconnected:
-                self.disconnect(conn, user_id)
+        await self.broker.publish({"message": message, "user_ids": [user_id]})
     
     async def broadcast_to_chat(self, message: dict, chat_id: int, exclude_user_id: int = None):
         """Отправка сообщения всем участникам чата"""
-        if chat_id in self.chat_members:
-            for user_id in self.chat_members[chat_id]:
-                if exclude_user_id and user_id == exclude_user_id:
-                    continue
-                await self.send_personal_message(message, user_id)
+        await self.broadcast_to_chats(message, [chat_id], exclude_user_id)
+    
+    async def broadcast_to_chats(self, message: dict, chat_ids: Iterable[int], exclude_user_id: int = None):
+        """Отправка сообщения участникам нескольких чатов (каждому один раз)"""
+        await self.broker.publish({
+            "message": message,
+            "chat_ids": list(chat_ids),
+            "exclude_user_id": exclude_user_id,
+        })
     
     async def broadcast_to_users(self, message: dict, user_ids: List[int]):
         """Отправка сообщения списку пользователей"""
-        for user_id in user_ids:
-            await self.send_personal_message(message, user_id)
-    
-    def add_user_to_chat(self, user_id: int, chat_id: int):
-        """Добавить пользователя в чат"""
-        if chat_id not in self.chat_members:
-            self.chat_members[chat_id] = set()
-        self.chat_members[chat_id].add(user_id)
-        
-        if user_id not in self.user_chats:
-            self.user_chats[user_id] = set()
-        self.user_chats[user_id].add(chat_id)
-    
-    def remove_user_from_chat(self, user_id: int, chat_id: int):
-        """Удалить пользователя из чата"""
-        if chat_id in self.chat_members:
-            self.chat_members[chat_id].discard(user_id)
-        if user_id in self.user_chats:
-            self.user_chats[user_id].discard(chat_id)
+        await self.broker.publish({"message": message, "user_ids": list(user_ids)})
     
     async def send_typing_indicator(self, chat_id: int, user_id: int, is_typing: bool):
         """Отправка индикатора печати"""
@@ -109,21 +314,10 @@ class ConnectionManager:
             "message": message_data,
             "timestamp": datetime.utcnow().isoformat()
         }
-        logger.info(f"Sending new_message notification for chat {chat_id} to all members except {sender_id}")
+        logger.debug("new_message for chat %s from user %s", chat_id, sender_id)
         
         # Отправляем всем участникам чата
-        if chat_id in self.chat_members:
-            logger.info(f"Chat {chat_id} has {len(self.chat_members[chat_id])} members")
-            for user_id in self.chat_members[chat_id]:
-                if user_id != sender_id:
-                    await self.send_personal_message(notification, user_id)
-                    logger.info(f"Sent notification to user {user_id}")
-        else:
-            logger.warning(f"Chat {chat_id} has no members in WebSocket manager")
-            # Отправляем всем подключенным пользователям (fallback)
-            for user_id in self.active_connections.keys():
-                if user_id != sender_id:
-                    await self.send_personal_message(notification, user_id)
+        await self.broadcast_to_chat(notification, chat_id, exclude_user_id=sender_id)
     
     async def send_message_update(self, chat_id: int, message_id: int, content: str):
         """Отправка уведомления об обновлении сообщения"""
@@ -154,10 +348,10 @@ class ConnectionManager:
             "status": status,
             "timestamp": datetime.utcnow().isoformat()
         }
-        # Отправить всем чатам, где есть этот пользователь
-        if user_id in self.user_chats:
-            for chat_id in self.user_chats[user_id]:
-                await self.broadcast_to_chat(message, chat_id, exclude_user_id=user_id)
+        # Отправить всем чатам, где есть этот пользователь (каждому получателю один раз)
+        chat_ids = await self.membership.get_user_chats(user_id)
+        if chat_ids:
+            await self.broadcast_to_chats(message, chat_ids, exclude_user_id=user_id)
     
     async def send_task_notification(self, user_id: int, task_id: int, task_title: str, assigned_by: int):
         """Отправка уведомления о назначении задачи"""
@@ -168,11 +362,8 @@ class ConnectionManager:
             "assigned_by": assigned_by,
             "timestamp": datetime.utcnow().isoformat()
         }
-        logger.info(f"📋 Preparing to send task notification to user {user_id}")
-        logger.info(f"📋 User {user_id} online: {self.is_user_online(user_id)}")
-        logger.info(f"📋 Message: {message}")
+        logger.debug("task_assigned %s to user %s", task_id, user_id)
         await self.send_personal_message(message, user_id)
-        logger.info(f"✅ Sent task notification to user {user_id} for task {task_id}")
     
     async def send_route_notification(self, user_id: int, route_id: int, route_title: str, assigned_by: int):
         """Отправка уведомления о назначении маршрута"""
@@ -183,113 +374,105 @@ class ConnectionManager:
             "assigned_by": assigned_by,
             "timestamp": datetime.utcnow().isoformat()
         }
-        logger.info(f"🗺️ Preparing to send route notification to user {user_id}")
-        logger.info(f"🗺️ User {user_id} online: {self.is_user_online(user_id)}")
+        logger.debug("route_assigned %s to user %s", route_id, user_id)
         await self.send_personal_message(message, user_id)
-        logger.info(f"✅ Sent route notification to user {user_id} for route {route_id}")
 
 
-manager = ConnectionManager()
+manager = ConnectionManager(membership)
 
 
 async def websocket_endpoint(websocket: WebSocket, token: Optional[str] = Query(None)):
     """WebSocket endpoint для реального времени"""
-    logger.info(f"WebSocket connection attempt with token: {token[:20] if token else 'None'}...")
-    
     # Валидация JWT токена
     if not token:
         logger.error("No token provided")
         await websocket.close(code=1008, reason="No token provided")
         return
     
-    try:
-        # Декодируем токен
-        payload = jwt.decode(
-            token, 
-            settings.SECRET_KEY, 
-            algorithms=[settings.ALGORITHM]
-        )
-        user_id = int(payload.get("sub"))
-        if user_id is None:
-            await websocket.close(code=1008, reason="Invalid token")
-            return
-    except JWTError as e:
-        logger.error(f"JWT Error: {e}")
+    # Тот же проверенный кэш токенов, что и у HTTP-запросов
+    user_id = decode_token(token, "access")
+    if user_id is None:
+        logger.error("Invalid WebSocket token")
         await websocket.close(code=1008, reason="Invalid token")
         return
     
-    # Подключаем пользователя
-    await manager.connect(websocket, user_id)
+    # Подключаем пользователя (статус онлайн ставит manager.presence,
+    # участники чатов подгружаются лениво через manager.membership)
+    epoch, seq = await manager.connect(websocket, user_id)
     
-    # Загружаем все чаты пользователя и добавляем его в них
-    from app.core.database import async_session_maker
-    from app.models.chat import ChatMember
-    from app.models.user import User, UserStatus
-    from sqlalchemy import select
-    
-    async with async_session_maker() as db:
-        # Получаем чаты пользователя
-        result = await db.execute(
-            select(ChatMember.chat_id).where(ChatMember.user_id == user_id)
-        )
-        chat_ids = [row[0] for row in result.all()]
-        
-        for chat_id in chat_ids:
-            manager.add_user_to_chat(user_id, chat_id)
-            logger.info(f"Added user {user_id} to chat {chat_id}")
-        
-        # Устанавливаем статус онлайн
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalar_one_or_none()
-        if user:
-            user.status = UserStatus.ONLINE
-            user.last_seen = datetime.utcnow()
-            await db.commit()
-            logger.info(f"User {user_id} status set to online")
-    
-    # Отправляем подтверждение подключения
-    await websocket.send_json({
+    # Отправляем подтверждение подключения (epoch/seq - позиция для resume)
+    manager.send_to_connection(websocket, {
         "type": "connected",
         "user_id": user_id,
+        "epoch": epoch,
+        "seq": seq,
         "timestamp": datetime.utcnow().isoformat()
     })
     
-    # Уведомляем других пользователей о статусе онлайн
-    await manager.send_user_status(user_id, "online")
+    codec = manager.codec_for(websocket)
     
     try:
         while True:
-            # Получаем данные от клиента
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            # Получаем данные от клиента (текст или бинарный кадр)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            manager.heartbeat.touch(websocket)
+            data = frame.get("bytes") if frame.get("bytes") is not None else frame.get("text")
+            check_frame_size(data, settings.WS_MAX_INBOUND_BYTES)
+            message_data = codec.decode(data)
             
             message_type = message_data.get("type")
             
             # Обработка разных типов сообщений
             if message_type == "ping":
                 # Ответ на ping
-                await websocket.send_json({
+                manager.send_to_connection(websocket, {
                     "type": "pong",
                     "timestamp": datetime.utcnow().isoformat()
                 })
             
-            elif message_type == "typing":
-                # Индикатор печати
-                chat_id = message_data.get("chat_id")
-                is_typing = message_data.get("is_typing", True)
-                await manager.send_typing_indicator(chat_id, user_id, is_typing)
+            elif message_type == "pong":
+                # Ответ на серверный heartbeat - соединение уже отмечено живым
+                pass
             
-            elif message_type == "join_chat":
-                # Присоединение к чату
+            elif message_type == "resume":
+                # Догрузка событий, пропущенных пока соединение было разорвано
+                last_seq = message_data.get("last_seq")
+                missed = None
+                if isinstance(last_seq, int):
+                    missed = manager.replay.replay(user_id, message_data.get("epoch"), last_seq)
+                
+                if missed is None:
+                    # Буфер не покрывает разрыв - клиент перезагружает данные по REST
+                    epoch, seq = manager.replay.attach(user_id)
+                    manager.send_to_connection(websocket, {
+                        "type": "resume_failed",
+                        "epoch": epoch,
+                        "seq": seq,
+                        "timestamp": datetime.utcnow().isoformat()
+                    })
+                else:
+                    for event in missed:
+                        manager.send_to_connection(websocket, event)
+                    manager.send_to_connection(websocket, {
+                        "type": "resumed",
+                        "count": len(missed),
+                        "timestamp": datetime.utcnow().isoformat()
+                    })
+            
+            elif message_type == "typing":
+                # Индикатор печати (схлопывается и ограничивается manager.typing)
                 chat_id = message_data.get("chat_id")
-                manager.add_user_to_chat(user_id, chat_id)
-                logger.info(f"User {user_id} joined chat {chat_id}")
+                is_typing = bool(message_data.get("is_typing", True))
+                if isinstance(chat_id, int) and await manager.membership.is_member(chat_id, user_id):
+                    await manager.typing.update(chat_id, user_id, is_typing)
             
-            elif message_type == "leave_chat":
-                # Выход из чата
+            elif message_type in ("join_chat", "leave_chat"):
+                # Состав чатов берётся из БД: перечитываем запись чата
                 chat_id = message_data.get("chat_id")
-                manager.remove_user_from_chat(user_id, chat_id)
-                logger.info(f"User {user_id} left chat {chat_id}")
+                manager.membership.invalidate_chat(chat_id, [user_id])
+                logger.debug("User %s refreshed membership of chat %s", user_id, chat_id)
             
             elif message_type == "status":
                 # Обновление статуса
@@ -297,8 +480,13 @@ async def websocket_endpoint(websocket: WebSocket, token: Optional[str] = Query(
                 await manager.send_user_status(user_id, status)
             
             elif message_type == "read_messages":
-                # Отметка сообщений как прочитанных
+                # Отметка сообщений как прочитанных (тот же сброс, что и в REST)
                 chat_id = message_data.get("chat_id")
+                if not isinstance(chat_id, int):
+                    continue
+                async with async_session_maker() as db:
+                    if not await mark_chat_read(db, chat_id, user_id):
+                        continue
                 read_notification = {
                     "type": "messages_read",
                     "chat_id": chat_id,
@@ -307,54 +495,21 @@ async def websocket_endpoint(websocket: WebSocket, token: Optional[str] = Query(
                 }
                 # Отправляем всем участникам чата, включая отправителя
                 await manager.broadcast_to_chat(read_notification, chat_id)
-                logger.info(f"User {user_id} marked messages as read in chat {chat_id}")
+                logger.debug("User %s marked messages as read in chat %s", user_id, chat_id)
             
             else:
-                logger.warning(f"Unknown message type: {message_type}")
+                logger.warning("Unknown message type: %s", message_type)
     
     except WebSocketDisconnect:
+        # Статус офлайн выставит manager.presence, если пользователь не переподключится
         manager.disconnect(websocket, user_id)
-        logger.info(f"User {user_id} disconnected")
-        
-        # Устанавливаем статус офлайн в БД
-        from app.core.database import async_session_maker
-        from app.models.user import User, UserStatus
-        from sqlalchemy import select
-        
-        async with async_session_maker() as db:
-            result = await db.execute(select(User).where(User.id == user_id))
-            user = result.scalar_one_or_none()
-            if user:
-                user.status = UserStatus.OFFLINE
-                user.last_seen = datetime.utcnow()
-                await db.commit()
-                logger.info(f"User {user_id} status set to offline")
-        
-        # Уведомляем других пользователей о статусе офлайн
-        await manager.send_user_status(user_id, "offline")
-        
-        # Уведомление об отключении
-        if user_id in manager.user_chats:
-            for chat_id in manager.user_chats[user_id]:
-                await manager.broadcast_to_chat({
-                    "type": "user_offline",
-                    "user_id": user_id,
-                    "timestamp": datetime.utcnow().isoformat()
-                }, chat_id)
+        logger.info("User %s disconnected", user_id)
+    
+    except FrameTooLarge:
+        logger.warning("User %s sent a frame over %s bytes", user_id, settings.WS_MAX_INBOUND_BYTES)
+        manager.disconnect(websocket, user_id)
+        await websocket.close(code=1009, reason="Message too big")
     
     except Exception as e:
-        logger.error(f"WebSocket error for user {user_id}: {e}")
+        logger.error("WebSocket error for user %s: %s", user_id, e)
         manager.disconnect(websocket, user_id)
-        
-        # Устанавливаем статус офлайн при ошибке
-        from app.core.database import async_session_maker
-        from app.models.user import User, UserStatus
-        from sqlalchemy import select
-        
-        async with async_session_maker() as db:
-            result = await db.execute(select(User).where(User.id == user_id))
-            user = result.scalar_one_or_none()
-            if user:
-                user.status = UserStatus.OFFLINE
-                user.last_seen = datetime.utcnow()
-                await db.commit()
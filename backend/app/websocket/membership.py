@@ -0,0 +1,129 @@
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, FrozenSet, Iterable, Optional
+from collections import OrderedDict
+import asyncio
+import logging
+
+from app.core.database import async_session_maker
+from app.models.chat import Chat, ChatMember
+
+logger = logging.getLogger(__name__)
+
+
+class _LazyIndex:
+    """LRU-кэш множеств id, которые подгружаются из БД по первому запросу"""
+
+    def __init__(self, column, key_column, max_entries: int):
+        self._column = column
+        self._key_column = key_column
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[int, FrozenSet[int]]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Future] = {}
+        # Поколения нужны, чтобы не сохранить результат загрузки, устаревший из-за инвалидации
+        self._generation = 0
+
+    async def get(self, key: int, db: Optional[AsyncSession] = None) -> FrozenSet[int]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+
+        # Одна загрузка на ключ, даже если запросов несколько
+        pending = self._loading.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        generation = self._generation
+        try:
+            entry = await self._load(key, db)
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже получит текущий вызов
+            future.exception()
+            raise
+        finally:
+            self._loading.pop(key, None)
+
+        if generation == self._generation:
+            self._entries[key] = entry
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(entry)
+        return entry
+
+    async def _load(self, key: int, db: Optional[AsyncSession]) -> FrozenSet[int]:
+        query = select(self._column).where(self._key_column == key)
+        if db is not None:
+            result = await db.execute(query)
+        else:
+            async with async_session_maker() as session:
+                result = await session.execute(query)
+        return frozenset(row[0] for row in result.all())
+
+    def peek(self, key: int) -> Optional[FrozenSet[int]]:
+        return self._entries.get(key)
+
+    def invalidate(self, key: int):
+        self._generation += 1
+        self._entries.pop(key, None)
+
+
+class MembershipIndex:
+    """Ленивый кэш участников чатов, общий для REST и WebSocket.
+
+    Записи загружаются из chat_members по первому обращению и сбрасываются
+    эндпоинтами, которые меняют состав чатов (через manager.invalidate_chat,
+    чтобы сброс дошёл до всех воркеров).
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        # chat_id -> user_ids
+        self._chat_members = _LazyIndex(ChatMember.user_id, ChatMember.chat_id, max_entries)
+        # user_id -> chat_ids
+        self._user_chats = _LazyIndex(ChatMember.chat_id, ChatMember.user_id, max_entries)
+
+    async def get_chat_members(self, chat_id: int, db: Optional[AsyncSession] = None) -> FrozenSet[int]:
+        """Участники чата"""
+        return await self._chat_members.get(chat_id, db)
+
+    async def get_user_chats(self, user_id: int, db: Optional[AsyncSession] = None) -> FrozenSet[int]:
+        """Чаты пользователя"""
+        return await self._user_chats.get(user_id, db)
+
+    async def is_member(self, chat_id: int, user_id: int, db: Optional[AsyncSession] = None) -> bool:
+        """Проверка членства в чате"""
+        return user_id in await self.get_chat_members(chat_id, db)
+
+    def invalidate_chat(self, chat_id: int, user_ids: Iterable[int] = ()):
+        """Сброс записей чата и затронутых пользователей"""
+        affected = set(user_ids)
+        members = self._chat_members.peek(chat_id)
+        if members:
+            affected.update(members)
+        self._chat_members.invalidate(chat_id)
+        for user_id in affected:
+            self._user_chats.invalidate(user_id)
+
+
+async def mark_chat_read(db: AsyncSession, chat_id: int, user_id: int) -> bool:
+    """Прочитано всё до последнего сообщения чата (один атомарный UPDATE).
+
+    Возвращает False, если пользователь не участник чата.
+    """
+    result = await db.execute(
+        update(ChatMember)
+        .where(ChatMember.chat_id == chat_id, ChatMember.user_id == user_id)
+        .values(
+            unread_count=0,
+            last_read_message_id=select(Chat.last_message_id).where(Chat.id == chat_id).scalar_subquery(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+
+membership = MembershipIndex()
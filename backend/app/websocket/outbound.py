@@ -0,0 +1,133 @@
+from fastapi import WebSocket
+from typing import Callable, Deque, Hashable, Optional, Tuple, Union
+from collections import deque
+import asyncio
+import enum
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BackpressurePolicy(str, enum.Enum):
+    """Поведение при переполнении исходящей очереди соединения.
+
+    Политики накопительные: COALESCE сначала схлопывает кадры с одинаковым
+    ключом, затем выкидывает typing; DROP_TYPING только выкидывает typing;
+    DISCONNECT сразу отключает медленного клиента.
+    """
+    COALESCE = "coalesce"
+    DROP_TYPING = "drop_typing"
+    DISCONNECT = "disconnect"
+
+
+# (тип события, ключ схлопывания, сериализованный кадр: str - текст, bytes - бинарный)
+Frame = Tuple[str, Optional[Hashable], Union[str, bytes]]
+
+# Результаты разбора переполнения очереди
+_COALESCED = "coalesced"
+_DROPPED = "dropped"
+_FREED = "freed"
+_OVERFLOW = "overflow"
+
+
+class ConnectionWriter:
+    """Ограниченная исходящая очередь соединения и задача, которая её разгружает"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        codec,
+        max_size: int,
+        policy: BackpressurePolicy,
+        send_timeout: float,
+        on_failure: Callable[["ConnectionWriter"], None],
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        # Кодек, согласованный с клиентом (см. app.websocket.codec)
+        self.codec = codec
+        self.max_size = max_size
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self._on_failure = on_failure
+        self._queue: Deque[Frame] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def start(self):
+        """Запуск задачи-писателя"""
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Остановка задачи-писателя (без ожидания)"""
+        self.closed = True
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._queue.clear()
+
+    def enqueue(self, event_type: str, data: Union[str, bytes], coalesce_key: Optional[Hashable] = None) -> bool:
+        """Постановка кадра в очередь. False - клиент не успевает, его нужно отключить"""
+        if self.closed:
+            return True
+
+        if len(self._queue) >= self.max_size:
+            outcome = self._make_room(event_type, data, coalesce_key)
+            if outcome == _OVERFLOW:
+                return False
+            if outcome in (_COALESCED, _DROPPED):
+                return True
+
+        self._queue.append((event_type, coalesce_key, data))
+        self._wakeup.set()
+        return True
+
+    def _make_room(self, event_type: str, data: Union[str, bytes], coalesce_key: Optional[Hashable]) -> str:
+        """Разбор переполнения очереди согласно политике"""
+        if self.policy == BackpressurePolicy.DISCONNECT:
+            return _OVERFLOW
+
+        if self.policy == BackpressurePolicy.COALESCE and coalesce_key is not None:
+            for index, (queued_type, queued_key, _) in enumerate(self._queue):
+                if queued_key == coalesce_key:
+                    # Сохраняем позицию, но отправим самое свежее состояние
+                    self._queue[index] = (queued_type, queued_key, data)
+                    return _COALESCED
+
+        if event_type == "typing":
+            # Новый typing при полной очереди просто отбрасываем
+            return _DROPPED
+
+        for index, (queued_type, _, _) in enumerate(self._queue):
+            if queued_type == "typing":
+                del self._queue[index]
+                return _FREED
+
+        return _OVERFLOW
+
+    async def _run(self):
+        try:
+            while not self.closed:
+                if not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                _, _, data = self._queue.popleft()
+                if isinstance(data, bytes):
+                    send = self.websocket.send_bytes(data)
+                else:
+                    send = self.websocket.send_text(data)
+                try:
+                    await asyncio.wait_for(send, timeout=self.send_timeout)
+                except asyncio.TimeoutError:
+                    logger.warning("WebSocket send timed out for user %s, evicting stalled connection", self.user_id)
+                    self._on_failure(self)
+                    return
+                except Exception as e:
+                    logger.error("Error sending message to user %s: %s", self.user_id, e)
+                    self._on_failure(self)
+                    return
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,239 @@
+from sqlalchemy import update
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from datetime import datetime
+import asyncio
+import logging
+import time
+import uuid
+
+from app.core.cache import user_cache
+from app.core.database import async_session_maker
+from app.models.user import User, UserStatus
+
+logger = logging.getLogger(__name__)
+
+# Колбэк смены статуса: (user_id, "online" | "offline")
+StatusCallback = Callable[[int, str], Awaitable[None]]
+# Публикация конверта присутствия во все процессы (брокер)
+PresencePublisher = Callable[[dict], Awaitable[None]]
+
+# Процесс без снимка за столько интервалов записи считается упавшим
+SNAPSHOT_TTL_INTERVALS = 3
+
+
+class PresenceTracker:
+    """Онлайн-статусы пользователей с учётом соединений всех воркеров.
+
+    Отключение считается уходом в офлайн только если пользователь не
+    переподключился за grace_period, поэтому переподключения после деплоя не
+    дёргают статус. Изменения копятся и пишутся в users одним пакетным
+    UPDATE раз в flush_interval секунд.
+
+    Если задан publish, процессы обмениваются своими онлайн-пользователями
+    (события "up"/"down" и полный снимок раз в flush_interval), и офлайн
+    выставляется, только когда пользователя нет ни в одном процессе. Без
+    publish (брокер memory, один воркер) учитываются только свои соединения.
+    """
+
+    def __init__(self, grace_period: float, flush_interval: float):
+        self.grace_period = grace_period
+        self.flush_interval = flush_interval
+        self.on_change: Optional[StatusCallback] = None
+        self.publish: Optional[PresencePublisher] = None
+        self.origin = uuid.uuid4().hex
+        # user_id -> количество открытых соединений
+        self._connections: Dict[int, int] = {}
+        # user_id -> отложенный уход в офлайн
+        self._offline_timers: Dict[int, asyncio.TimerHandle] = {}
+        # user_id -> (статус, last_seen), ещё не записанные в БД
+        self._dirty: Dict[int, Tuple[UserStatus, datetime]] = {}
+        # origin другого процесса -> его онлайн-пользователи / время последнего события
+        self._remote: Dict[str, Set[int]] = {}
+        self._remote_seen: Dict[str, float] = {}
+        # Ушли из этого процесса, оставаясь онлайн в другом: офлайн решится позже
+        self._deferred: Set[int] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        # Фоновые рассылки статусов (ссылки держим до завершения задач)
+        self._tasks: Set[asyncio.Task] = set()
+
+    def start(self):
+        """Запуск периодической записи в БД"""
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Остановка и запись накопленных изменений"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        for task in list(self._tasks):
+            task.cancel()
+        for handle in self._offline_timers.values():
+            handle.cancel()
+        # Все соединения процесса закрываются вместе с ним;
+        # подключённые к другим воркерам остаются онлайн
+        for user_id in self._local_users():
+            if not self._remote_has(user_id):
+                self._dirty[user_id] = (UserStatus.OFFLINE, datetime.utcnow())
+        self._connections.clear()
+        self._offline_timers.clear()
+        await self.flush()
+        await self._publish({"kind": "snapshot", "user_ids": []})
+
+    def is_online(self, user_id: int) -> bool:
+        """Онлайн ли пользователь (с учётом периода ожидания переподключения)"""
+        return user_id in self._connections or user_id in self._offline_timers or self._remote_has(user_id)
+
+    def online_users(self) -> List[int]:
+        """Список онлайн пользователей"""
+        users = set(self._local_users())
+        for remote in self._remote.values():
+            users |= remote
+        return list(users)
+
+    def connected(self, user_id: int):
+        """Открыто новое соединение пользователя"""
+        self._connections[user_id] = self._connections.get(user_id, 0) + 1
+
+        pending = self._offline_timers.pop(user_id, None)
+        if pending is not None:
+            # Переподключение в пределах grace_period - статус не меняется
+            pending.cancel()
+            return
+
+        if self._connections[user_id] == 1:
+            self._spawn(self._publish({"kind": "up", "user_id": user_id}))
+            if user_id in self._deferred or self._remote_has(user_id):
+                # Уже онлайн через другой воркер
+                self._deferred.discard(user_id)
+                return
+            self._set_status(user_id, UserStatus.ONLINE)
+
+    def disconnected(self, user_id: int):
+        """Закрыто соединение пользователя"""
+        count = self._connections.get(user_id, 0) - 1
+        if count > 0:
+            self._connections[user_id] = count
+            return
+
+        self._connections.pop(user_id, None)
+        if user_id not in self._offline_timers:
+            loop = asyncio.get_running_loop()
+            self._offline_timers[user_id] = loop.call_later(self.grace_period, self._went_offline, user_id)
+
+    def _went_offline(self, user_id: int):
+        self._offline_timers.pop(user_id, None)
+        if user_id in self._connections:
+            return
+        elsewhere = self._remote_has(user_id)
+        # handled: офлайн выставлен этим процессом, остальным ничего делать не нужно
+        self._spawn(self._publish({"kind": "down", "user_id": user_id, "handled": not elsewhere}))
+        if elsewhere:
+            self._deferred.add(user_id)
+        else:
+            self._set_status(user_id, UserStatus.OFFLINE)
+
+    async def handle(self, envelope: dict):
+        """Конверт присутствия из брокера (свои пропускаются)"""
+        origin = envelope["origin"]
+        if origin == self.origin:
+            return
+        remote = self._remote.setdefault(origin, set())
+        self._remote_seen[origin] = time.monotonic()
+
+        kind = envelope["kind"]
+        if kind == "up":
+            remote.add(envelope["user_id"])
+        elif kind == "down":
+            user_id = envelope["user_id"]
+            remote.discard(user_id)
+            if envelope.get("handled"):
+                self._deferred.discard(user_id)
+            else:
+                self._settle(user_id)
+        elif kind == "snapshot":
+            # Снимок исправляет пропущенные или переупорядоченные up/down
+            users = set(envelope["user_ids"])
+            gone = remote - users
+            self._remote[origin] = users
+            for user_id in gone:
+                self._settle(user_id)
+
+    def _settle(self, user_id: int):
+        """Отложенный уход в офлайн, когда пользователя не осталось ни в одном процессе"""
+        if user_id in self._deferred and not self.is_online(user_id):
+            self._deferred.discard(user_id)
+            self._set_status(user_id, UserStatus.OFFLINE)
+
+    def _expire_remote(self):
+        """Пользователи упавших воркеров: их в офлайн переводит любой живой процесс"""
+        cutoff = time.monotonic() - self.flush_interval * SNAPSHOT_TTL_INTERVALS
+        for origin in [origin for origin, seen in self._remote_seen.items() if seen < cutoff]:
+            del self._remote_seen[origin]
+            for user_id in self._remote.pop(origin, ()):
+                self._deferred.add(user_id)
+                self._settle(user_id)
+
+    def _local_users(self) -> List[int]:
+        return list(set(self._connections) | set(self._offline_timers))
+
+    def _remote_has(self, user_id: int) -> bool:
+        return any(user_id in users for users in self._remote.values())
+
+    async def _publish(self, envelope: dict):
+        if self.publish is None:
+            return
+        try:
+            await self.publish({**envelope, "origin": self.origin})
+        except Exception as e:
+            logger.error("Error publishing presence: %s", e)
+
+    def _spawn(self, coro: Awaitable[None]):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _set_status(self, user_id: int, status: UserStatus):
+        self._dirty[user_id] = (status, datetime.utcnow())
+        if self.on_change:
+            self._spawn(self._notify(user_id, status.value))
+
+    async def _notify(self, user_id: int, status: str):
+        try:
+            await self.on_change(user_id, status)
+        except Exception as e:
+            logger.error("Error broadcasting status of user %s: %s", user_id, e)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.publish is not None:
+                self._expire_remote()
+                await self._publish({"kind": "snapshot", "user_ids": self._local_users()})
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Presence flush failed: %s", e)
+
+    async def flush(self):
+        """Пакетная запись накопленных статусов в users"""
+        if not self._dirty:
+            return
+
+        batch, self._dirty = self._dirty, {}
+        try:
+            async with async_session_maker() as db:
+                await db.execute(
+                    update(User),
+                    [
+                        {"id": user_id, "status": status, "last_seen": last_seen}
+                        for user_id, (status, last_seen) in batch.items()
+                    ],
+                )
+                await db.commit()
+            user_cache.invalidate_many(batch)
+        except Exception:
+            # Не теряем изменения: более свежие значения имеют приоритет
+            for user_id, value in batch.items():
+                self._dirty.setdefault(user_id, value)
+            raise
+        logger.debug("Presence flushed for %s users", len(batch))
@@ -0,0 +1,106 @@
+from typing import Deque, Dict, List, Optional, Tuple
+from collections import deque
+import time
+import uuid
+
+# События, которые нумеруются и догружаются после переподключения.
+# typing, user_status и т.п. устаревают мгновенно и в буфер не попадают.
+SEQUENCED_EVENTS = frozenset({
+    "new_message",
+    "message_updated",
+    "message_deleted",
+    "messages_read",
+    "task_assigned",
+    "route_assigned",
+})
+
+
+class _Stream:
+    __slots__ = ("epoch", "seq", "events", "detached_at")
+
+    def __init__(self, size: int):
+        # Эпоха меняется при создании потока: по ней клиент понимает, что
+        # номера из другого процесса или после рестарта несопоставимы
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self.events: Deque[Tuple[int, dict]] = deque(maxlen=size)
+        self.detached_at: Optional[float] = None
+
+
+class ReplayBuffer:
+    """Нумерация событий пользователя и кольцевой буфер для их догрузки.
+
+    Поток пользователя живёт, пока у него есть соединение, и ещё retention
+    секунд после отключения. Клиент присылает {"type": "resume", "epoch",
+    "last_seq"} и получает только пропущенные события; повторы с seq, который
+    он уже видел, клиент отбрасывает сам.
+    """
+
+    def __init__(self, size: int, retention: float):
+        self.size = size
+        self.retention = retention
+        self._streams: Dict[int, _Stream] = {}
+
+    def attach(self, user_id: int) -> Tuple[str, int]:
+        """Соединение открыто: (эпоха, последний номер) для подтверждения"""
+        self.purge()
+        stream = self._streams.get(user_id)
+        if stream is None:
+            stream = self._streams[user_id] = _Stream(self.size)
+        stream.detached_at = None
+        return stream.epoch, stream.seq
+
+    def detach(self, user_id: int):
+        """Закрыто последнее соединение: начинается срок хранения"""
+        stream = self._streams.get(user_id)
+        if stream is not None:
+            stream.detached_at = time.monotonic()
+
+    def has_streams(self) -> bool:
+        return bool(self._streams)
+
+    def tracks(self, user_id: int) -> bool:
+        """Нужно ли нумеровать события пользователя"""
+        stream = self._streams.get(user_id)
+        if stream is None:
+            return False
+        if stream.detached_at is not None and time.monotonic() - stream.detached_at > self.retention:
+            del self._streams[user_id]
+            return False
+        return True
+
+    def record(self, user_id: int, message: dict) -> dict:
+        """Присвоение номера событию и сохранение его в буфере"""
+        stream = self._streams[user_id]
+        stream.seq += 1
+        stamped = {**message, "seq": stream.seq}
+        stream.events.append((stream.seq, stamped))
+        return stamped
+
+    def replay(self, user_id: int, epoch: Optional[str], last_seq: int) -> Optional[List[dict]]:
+        """События после last_seq; None - догрузить нельзя (нужна загрузка по REST).
+
+        Без эпохи номер last_seq мог относиться к прежнему потоку (рестарт,
+        истёкший буфер), поэтому такой resume тоже требует полной загрузки.
+        """
+        stream = self._streams.get(user_id)
+        if stream is None or epoch is None or epoch != stream.epoch:
+            return None
+        if last_seq > stream.seq:
+            return None
+        if last_seq == stream.seq:
+            return []
+        # Самое старое доступное событие должно идти сразу после last_seq
+        if not stream.events or stream.events[0][0] > last_seq + 1:
+            return None
+        return [event for seq, event in stream.events if seq > last_seq]
+
+    def purge(self):
+        """Удаление потоков, срок хранения которых истёк"""
+        now = time.monotonic()
+        expired = [
+            user_id for user_id, stream in self._streams.items()
+            if stream.detached_at is not None and now - stream.detached_at > self.retention
+        ]
+        for user_id in expired:
+            del self._streams[user_id]
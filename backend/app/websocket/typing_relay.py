@@ -0,0 +1,96 @@
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Рассылка индикатора: (chat_id, user_id, is_typing)
+TypingPublisher = Callable[[int, int, bool], Awaitable[None]]
+
+
+class TypingRelay:
+    """Ретранслятор индикаторов печати.
+
+    Повторные кадры одного пользователя в чате схлопываются в пределах
+    coalesce_window, индикатор гаснет сам через ttl без нового кадра, а на
+    каждый чат действует лимит max_per_second событий "печатает".
+    """
+
+    SWEEP_INTERVAL = 1.0
+
+    def __init__(self, publish: TypingPublisher, coalesce_window: float, ttl: float, max_per_second: float):
+        self.publish = publish
+        self.coalesce_window = coalesce_window
+        self.ttl = ttl
+        self.max_per_second = max_per_second
+        # (chat_id, user_id) -> момент, когда индикатор погаснет
+        self._expires: Dict[Tuple[int, int], float] = {}
+        # (chat_id, user_id) -> момент последней рассылки "печатает"
+        self._last_sent: Dict[Tuple[int, int], float] = {}
+        # chat_id -> (токены, момент пополнения)
+        self._buckets: Dict[int, Tuple[float, float]] = {}
+        self._sweep_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    def stop(self):
+        if self._sweep_task:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+
+    async def update(self, chat_id: int, user_id: int, is_typing: bool):
+        """Обработка кадра typing от клиента"""
+        key = (chat_id, user_id)
+        now = time.monotonic()
+
+        if not is_typing:
+            self._expires.pop(key, None)
+            if self._last_sent.pop(key, None) is not None:
+                await self.publish(chat_id, user_id, False)
+            return
+
+        self._expires[key] = now + self.ttl
+        last_sent = self._last_sent.get(key)
+        if last_sent is not None and now - last_sent < self.coalesce_window:
+            return
+        if not self._take_token(chat_id, now):
+            return
+
+        self._last_sent[key] = now
+        await self.publish(chat_id, user_id, True)
+
+    def _take_token(self, chat_id: int, now: float) -> bool:
+        tokens, refilled_at = self._buckets.get(chat_id, (self.max_per_second, now))
+        tokens = min(self.max_per_second, tokens + (now - refilled_at) * self.max_per_second)
+        if tokens < 1:
+            self._buckets[chat_id] = (tokens, now)
+            return False
+        self._buckets[chat_id] = (tokens - 1, now)
+        return True
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error("Typing sweep failed: %s", e)
+
+    async def sweep(self):
+        """Гашение просроченных индикаторов"""
+        now = time.monotonic()
+        expired = [key for key, expires_at in self._expires.items() if expires_at <= now]
+        for key in expired:
+            del self._expires[key]
+            if self._last_sent.pop(key, None) is not None:
+                await self.publish(key[0], key[1], False)
+
+        # Полные корзины ничего не ограничивают - их можно забыть
+        idle = [
+            chat_id for chat_id, (tokens, refilled_at) in self._buckets.items()
+            if tokens + (now - refilled_at) * self.max_per_second >= self.max_per_second
+        ]
+        for chat_id in idle:
+            del self._buckets[chat_id]